@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+from client_setup import client, connect_client, disconnect_client
+from config import BACKFILL_BATCH_SIZE, BACKFILL_CONCURRENCY, logger
+from data_manager import find_matching_products, get_product_name, new_matcher, reload_data
+from db import async_db
+from db.migrations import run_migrations
+from entity_cache import entity_cache
+from peer_ids import channel_peer_id
+from price_index import load_price_index
+from segmenter import find_priced_products
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S" # Same format (UTC) as SQLite's CURRENT_TIMESTAMP
+
+_running = asyncio.Lock()
+
+
+class BackfillResult(NamedTuple):
+    chat_id: int
+    messages: int
+    records: int
+    error: Optional[str]
+
+
+def is_running() -> bool:
+    """Returns True while a backfill is in progress."""
+    return _running.locked()
+
+def _single_product_matcher(product_id: int, product_name: str):
+    """Returns a match_products function that only knows one product."""
+    matcher = new_matcher([(product_id, product_name)]) # Same MATCH_MODE as live matching
+    return lambda text: [(product_id, product_name)] if matcher.match(text) else []
+
+async def _backfill_channel(client, channel_id, match_products, scope, since, checkpoint, semaphore) -> BackfillResult:
+    chat_id = channel_peer_id(channel_id)
+    since_text = since.strftime(TIMESTAMP_FORMAT)
+    last_message_id = 0
+    if checkpoint and checkpoint[0] <= since_text:
+        # The stored run already covers this window: carry on after its last message
+        since_text, last_message_id = checkpoint
+    # Otherwise read the whole window: posts recorded before (live or by
+    # another backfill) are skipped when saving, by their message ID
+
+    messages = records = unsaved = 0
+    pending = []
+    error = None
+    async with semaphore:
+        peer = entity_cache.get_input_peer(chat_id) or chat_id
+        try:
+            async for message in client.iter_messages(peer, reverse=True, offset_date=since, min_id=last_message_id):
+                last_message_id = message.id
+                messages += 1
+                unsaved += 1
+                text = message.raw_text
+                if text:
+                    created_at = message.date.strftime(TIMESTAMP_FORMAT)
+                    for product_id, _, price in find_priced_products(text, match_products).found:
+                        pending.append((product_id, price, "BRL", text, str(chat_id), message.id, created_at))
+                if unsaved >= BACKFILL_BATCH_SIZE:
+                    records += await async_db.save_backfill_batch(pending, chat_id, scope, since_text, last_message_id)
+                    pending = []
+                    unsaved = 0
+        except Exception as e:
+            error = str(e)
+            logger.error(f"⚠️ Backfill of {chat_id} stopped after {messages} messages: {e}")
+
+        if unsaved:
+            # Also saved after an error, so the next run resumes where this one stopped
+            records += await async_db.save_backfill_batch(pending, chat_id, scope, since_text, last_message_id)
+
+    logger.info(f"📚 Backfilled {chat_id}: {messages} messages, {records} price records.")
+    return BackfillResult(chat_id, messages, records, error)
+
+async def backfill(client, product_id: Optional[int], days: int) -> list[BackfillResult]:
+    """
+    Records the prices found in the last `days` days of every whitelisted
+    channel, for one product or (with None) the whole wishlist. Channels are
+    read BACKFILL_CONCURRENCY at a time and nothing is forwarded. Progress is
+    checkpointed per channel, so running it again continues after the last
+    processed message. Posts already recorded (live or by any earlier
+    backfill) are never recorded twice.
+    """
+    if product_id is None:
+        scope = "all"
+        match_products = find_matching_products
+    else:
+        product_name = get_product_name(product_id)
+        if product_name is None:
+            raise ValueError(f"Product ID {product_id} is not in the wishlist")
+        scope = f"product:{product_id}"
+        match_products = _single_product_matcher(product_id, product_name)
+
+    async with _running:
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        channel_ids = await async_db.list_whitelisted_channels()
+        checkpoints = await async_db.get_backfill_checkpoints(scope)
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        logger.info(f"📚 Backfilling {scope} over {days} days from {len(channel_ids)} channels...")
+
+        results = await asyncio.gather(*(
+            _backfill_channel(
+                client, channel_id, match_products, scope, since,
+                checkpoints.get(channel_peer_id(channel_id)),
+                semaphore,
+            )
+            for channel_id in channel_ids
+        ))
+
+        await load_price_index() # Backfilled minimums count for drop alerts
+        return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Record prices from the history of the whitelisted channels.")
+    parser.add_argument("target", help="Product ID, or 'all' for the whole wishlist")
+    parser.add_argument("days", type=int, help="How many days of history to read")
+    args = parser.parse_args()
+
+    product_id = None if args.target == "all" else int(args.target)
+
+    await async_db.run_db(run_migrations)
+    await reload_data()
+    await entity_cache.load()
+    if not await connect_client():
+        return
+    try:
+        results = await backfill(client, product_id, args.days)
+    finally:
+        await disconnect_client()
+        await async_db.close_db()
+
+    for result in results:
+        status = f"⚠️ {result.error}" if result.error else "✅"
+        print(f"{status} [{result.chat_id}] {result.messages} messages, {result.records} price records")
+    print(f"Total: {sum(r.records for r in results)} price records from {sum(r.messages for r in results)} messages.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
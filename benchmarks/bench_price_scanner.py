@@ -0,0 +1,68 @@
+"""
+Microbenchmark for the price scanner in utils.py.
+
+Compares the single-pass scan_prices() against the previous approach (one
+regex pass for the multi-product check and another for the price, both
+compiled on the fly) over the promo texts in promo_corpus.txt.
+
+Run from the repository root:
+    python benchmarks/bench_price_scanner.py [repeat]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import best_price, has_multiple_offers, scan_prices  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "promo_corpus.txt")
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [text.strip() for text in f.read().split("\n---\n") if text.strip()]
+
+def legacy_scan(text):
+    """The two scans the handler used to run per message."""
+    if len(re.findall(r"R\$\s*[\d.]+(?:,\d{2})?", text)) > 1:
+        return None
+    match = re.search(r"R\$\s*([\d.]+,\d{2}|\d+(?:\.\d{2})?)", text)
+    if match:
+        raw_price = match.group(1)
+        if "," in raw_price:
+            raw_price = raw_price.replace(".", "").replace(",", ".")
+        return float(raw_price)
+    return None
+
+def single_pass_scan(text):
+    prices = scan_prices(text)
+    if has_multiple_offers(prices):
+        return None
+    return best_price(prices)
+
+def bench(name, func, corpus, repeat):
+    total_chars = sum(len(text) for text in corpus) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            func(text)
+    elapsed = time.perf_counter() - start
+    messages = len(corpus) * repeat
+    print(f"{name:<12} {messages / elapsed:>12,.0f} msg/s {total_chars / elapsed / 1e6:>8.2f} MB/s  ({elapsed * 1e6 / messages:.2f} µs/msg)")
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus)} messages, {sum(len(t) for t in corpus)} chars, repeated {repeat}x\n")
+    bench("legacy", legacy_scan, corpus, repeat)
+    bench("scan_prices", single_pass_scan, corpus, repeat)
+
+    print("\nPer-message results (legacy -> single pass):")
+    for text in corpus:
+        first_line = text.splitlines()[0][:50]
+        print(f"  {first_line:<52} {legacy_scan(text)!s:>10} -> {single_pass_scan(text)!s:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Checks that MATCH_MODE=normalized finds every product exact mode finds.
+
+Normalized matching is meant to be the more lenient mode: a product that
+matches a message with whole-word matching must match it after
+normalization too. The wishlist is every run of 1-3 consecutive words of
+the corpus messages (so numbers, units and punctuation all show up in
+product names), plus any names given with --product. Exits with status 1
+and lists the misses if normalized mode drops a match.
+
+Run from the repository root:
+    python benchmarks/compare_match_modes.py [--corpus FILE] [--product "Kindle 16"]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import NormalizedMatcher, WishlistMatcher  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_corpus.jsonl")
+EXTRA_TEXTS = ("Smart TV 55 polegadas 4K", "Kindle 16 GB", "SSD 1TB NVMe", "Galaxy S24 128GB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare exact and normalized matching over a corpus.")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="JSON lines corpus, as used by replay.py")
+    parser.add_argument("--product", action="append", default=[], help="extra product name (repeatable)")
+    return parser.parse_args()
+
+def load_texts(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()] + list(EXTRA_TEXTS)
+
+def word_runs(texts, max_words=3):
+    names = set()
+    for text in texts:
+        words = [word for word in text.split() if not word.startswith("-")] # "-" starts a negative keyword in normalized mode
+        for size in range(1, max_words + 1):
+            names.update(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return sorted(names)
+
+def main():
+    args = parse_args()
+    texts = load_texts(args.corpus)
+    names = word_runs(texts) + args.product
+    wishlist = list(enumerate(names, start=1))
+    exact = WishlistMatcher(wishlist)
+    normalized = NormalizedMatcher(wishlist)
+
+    misses = []
+    matched = 0
+    for text in texts:
+        exact_ids = exact.match(text)
+        matched += len(exact_ids)
+        missing = set(exact_ids) - set(normalized.match(text))
+        misses.extend((names[product_id - 1], text) for product_id in sorted(missing))
+
+    print(f"{len(texts)} messages, {len(names)} products, {matched} exact matches, {len(misses)} missed in normalized mode.")
+    for name, text in misses:
+        print(f"  {name!r} not found in {text[:60]!r}")
+    return 1 if misses else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
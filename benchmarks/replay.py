@@ -0,0 +1,256 @@
+"""
+Replays a recorded corpus of channel messages through the full message
+pipeline, without a Telegram account.
+
+Each line of the corpus is a JSON object:
+    {"text": "...", "chat_id": -1001234567890, "peer_type": "channel", "date": "2025-05-01T12:00:00+00:00"}
+peer_type is "channel" or "chat"; an optional "whitelisted": false keeps the
+source off the whitelist so the filter rejects it.
+
+Messages go through process_channel_message (filter), the ingestion queue,
+matching, price extraction, the buffered price writer (persist) and the
+forward scheduler, whose client is replaced with a stub. Every run uses a
+fresh database in a temporary directory, seeded with a synthetic wishlist of
+the requested size built from the corpus vocabulary.
+
+Run from the repository root:
+    python benchmarks/replay.py [--corpus FILE] [--wishlist-sizes 10,1000,50000] [--repeat N]
+
+Repeats are identical texts, so the dedup cache is off unless --dedup is given.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_corpus.jsonl")
+STAGES = ("filter", "match", "extract", "persist", "forward")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a message corpus through the promo pipeline.")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="JSONL corpus of channel messages")
+    parser.add_argument("--wishlist-sizes", default="10,1000,10000,50000", help="Comma separated wishlist sizes to run")
+    parser.add_argument("--repeat", type=int, default=50, help="Times the corpus is replayed per run")
+    parser.add_argument("--forward-latency-ms", type=float, default=0, help="Simulated forward_messages latency")
+    parser.add_argument("--dedup", action="store_true", help="Keep the dedup cache enabled")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's INFO logs")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+ARGS = parse_args()
+
+# The pipeline reads its settings at import time. Fill in whatever the
+# environment doesn't set so config.py starts without a Telegram session and
+# nothing is throttled or dropped by the replay itself.
+for key, value in {
+    "API_ID": "1",
+    "API_HASH": "replay",
+    "STRING_SESSION": "replay",
+    "TARGET_FORWARD_CHANNEL_ID": "-1000000000001",
+    "INGEST_QUEUE_SIZE": "100000",
+    "INGEST_OVERFLOW_POLICY": "block",
+    "INGEST_STATS_INTERVAL": "0",
+    "FORWARD_RATE": "1000000",
+    "FORWARD_BURST": "1000000",
+    "FORWARD_BATCH_WINDOW_MS": "0",
+    "FORWARD_QUEUE_SIZE": "1000000",
+    "DEDUP_ENABLED": "1" if ARGS.dedup else "0",
+    "DEDUP_LOG_EVERY": "0",
+    "CATCHUP_ENABLED": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+import logging  # noqa: E402
+
+from telethon import utils  # noqa: E402
+from telethon.tl.types import PeerChannel, PeerChat  # noqa: E402
+
+import data_manager  # noqa: E402
+import dedup  # noqa: E402
+import handlers.forwarder  # noqa: E402
+import handlers.message_handler as message_handler  # noqa: E402
+import segmenter  # noqa: E402
+from config import logger  # noqa: E402
+from db import db, writer  # noqa: E402
+from db.migrations import run_migrations  # noqa: E402
+from handlers.forwarder import ForwardScheduler, forwarder  # noqa: E402
+from handlers.ingest_queue import ingest_queue  # noqa: E402
+from price_index import load_price_index  # noqa: E402
+
+
+class StubClient:
+    """Stands in for client_setup.client: every send succeeds after `latency` seconds."""
+
+    def __init__(self, latency: float):
+        self._latency = latency
+        self.forwarded = 0
+        self.sent = 0
+
+    def is_connected(self):
+        return True
+
+    async def forward_messages(self, entity, messages, from_peer):
+        await asyncio.sleep(self._latency)
+        self.forwarded += len(messages)
+
+    async def send_message(self, entity, message):
+        await asyncio.sleep(self._latency)
+        self.sent += 1
+
+
+class StageTimer:
+    """Collects latency samples (seconds) per pipeline stage."""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def wrap(self, stage, func):
+        samples = self.samples[stage]
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage, func):
+        samples = self.samples[stage]
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return timed
+
+    def report(self):
+        print(f"  {'stage':<8} {'calls':>8} {'p50 µs':>10} {'p99 µs':>10} {'max µs':>10}")
+        for stage, samples in self.samples.items():
+            if not samples:
+                print(f"  {stage:<8} {0:>8}")
+                continue
+            ordered = sorted(samples)
+            p50 = ordered[len(ordered) // 2]
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            print(f"  {stage:<8} {len(ordered):>8} {p50 * 1e6:>10.1f} {p99 * 1e6:>10.1f} {ordered[-1] * 1e6:>10.1f}")
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def synthetic_wishlist(corpus, size, seed):
+    """Product names of 1-3 words drawn from the corpus vocabulary, so some of them match."""
+    words = sorted({word for record in corpus for word in re.findall(r"[^\W\d_]{3,}", record["text"].lower())})
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < size:
+        names.add(" ".join(rng.sample(words, rng.choice((1, 2, 2, 3)))) + ("" if len(names) < len(words) else f" {len(names)}"))
+    return sorted(names)
+
+def make_event(record, message_id):
+    chat_id = record["chat_id"]
+    if record.get("peer_type", "channel") == "chat":
+        peer = PeerChat(abs(chat_id))
+    else:
+        peer = PeerChannel(int(str(chat_id)[4:]) if str(chat_id).startswith("-100") else abs(chat_id))
+    date = datetime.fromisoformat(record["date"]) if record.get("date") else None
+    return SimpleNamespace(
+        id=message_id,
+        chat_id=utils.get_peer_id(peer),
+        raw_text=record["text"],
+        message=SimpleNamespace(peer_id=peer, date=date),
+    )
+
+def db_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+def setup_database(directory, corpus, size, seed):
+    db.close_connection()
+    db.DB_PATH = os.path.join(directory, f"replay_{size}.db")
+    run_migrations()
+    conn = db.get_connection()
+    with conn:
+        conn.executemany("INSERT INTO watched_products (name) VALUES (?)", [(name,) for name in synthetic_wishlist(corpus, size, seed)])
+        conn.executemany(
+            "INSERT OR IGNORE INTO whitelisted_channels (channel_id) VALUES (?)",
+            [(record["chat_id"] if record.get("peer_type", "channel") == "channel" else abs(record["chat_id"]),)
+             for record in corpus if record.get("whitelisted", True)],
+        )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    data_manager.load_data()
+
+async def replay(corpus, size, directory, stub):
+    setup_database(directory, corpus, size, ARGS.seed)
+    await load_price_index()
+    dedup.duplicate_cache = dedup.DuplicateCache(dedup.DEDUP_CACHE_SIZE, dedup.DEDUP_WINDOW_SECONDS, dedup.DEDUP_SIMHASH_DISTANCE)
+    size_before = db_size(db.DB_PATH)
+    timer = StageTimer()
+
+    # Time each stage where the pipeline calls it
+    message_handler.find_matching_products = timer.wrap("match", data_manager.find_matching_products)
+    segmenter.scan_prices = timer.wrap("extract", original_scan_prices)
+    writer.add_price_records = timer.wrap_async("persist", original_add_price_records)
+    ForwardScheduler._send = timer.wrap_async("forward", original_send)
+    filter_message = timer.wrap_async("filter", message_handler.process_channel_message)
+
+    forwarded_before = stub.forwarded + stub.sent
+    writer.price_writer.start()
+    forwarder.start()
+    ingest_queue.start(message_handler.process_queued_message)
+
+    start = time.perf_counter()
+    messages = 0
+    for _ in range(ARGS.repeat):
+        for record in corpus:
+            messages += 1
+            # IDs keep growing across runs, the handler drops (chat, ID) pairs it has already queued
+            await filter_message(make_event(record, next(message_ids)))
+    await ingest_queue.stop(timeout=600)
+    await writer.price_writer.stop()
+    await forwarder.stop(timeout=600)
+    elapsed = time.perf_counter() - start
+
+    db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    records = db.get_connection().execute("SELECT COUNT(*) FROM price_history").fetchone()[0]
+    growth = db_size(db.DB_PATH) - size_before
+    print(f"\nWishlist {size:,} products: {messages:,} messages in {elapsed:.2f}s = {messages / elapsed:,.0f} msg/s")
+    print(f"  {records:,} price records, {stub.forwarded + stub.sent - forwarded_before:,} forwarded, "
+          f"DB grew {growth / 1024:,.1f} KiB ({growth / max(records, 1):,.0f} bytes/record)")
+    timer.report()
+
+
+message_ids = itertools.count(1)
+original_scan_prices = segmenter.scan_prices
+original_add_price_records = writer.add_price_records
+original_send = ForwardScheduler._send
+
+
+async def main():
+    if not ARGS.verbose:
+        logger.setLevel(logging.WARNING)
+    corpus = load_corpus(ARGS.corpus)
+    sizes = [int(size) for size in ARGS.wishlist_sizes.split(",")]
+    stub = StubClient(ARGS.forward_latency_ms / 1000)
+    handlers.forwarder.client = stub
+    print(f"Corpus: {len(corpus)} messages, replayed {ARGS.repeat}x per run, dedup {'on' if ARGS.dedup else 'off'}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            await replay(corpus, size, directory, stub)
+        db.close_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,41 +1,121 @@
 import asyncio
+import time
 
 from client_setup import client, connect_client, disconnect_client
-from config import ADMIN_USER_ID, TARGET_FORWARD_CHANNEL_ID, logger
-from handlers.message_handler import main_event_handler
+from config import (
+    ADMIN_USER_ID,
+    CATCHUP_ENABLED,
+    METRICS_HTTP_HOST,
+    METRICS_HTTP_PORT,
+    STARTED_AT,
+    logger,
+)
+from data_manager import reload_data
+from db.async_db import close_db, run_db
+from db.migrations import run_migrations
+from db.retention import source_retention
+from db.writer import price_writer
+from entity_cache import entity_cache
+from handlers.catch_up import catch_up, high_water_marks
+from handlers.forwarder import forwarder
+from handlers.ingest_queue import ingest_queue
+from handlers.message_handler import (
+    admin_event_handler,
+    admin_events,
+    channel_event_handler,
+    channel_events,
+    process_queued_message,
+)
+from metrics import start_http_server
+from price_index import load_price_index
+from routes import load_routes, route_table
+
+
+class StartupTimer:
+    """Times consecutive startup phases, for one summary log line once the bot is listening."""
+
+    def __init__(self, started_at: float):
+        self._started_at = started_at
+        self._last = started_at
+        self._phases = []
+
+    def mark(self, phase: str):
+        """Ends `phase` now; the next phase starts here."""
+        now = time.perf_counter()
+        self._phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self._phases)
+        logger.info(f"⏱️ Started in {(self._last - self._started_at) * 1000:.0f}ms: {phases}.")
 
 
 async def verify_target_channel():
-    """Verifies access to the target forwarding channel if configured."""
-    if TARGET_FORWARD_CHANNEL_ID != 0:
-        if not client or not client.is_connected():
-            logger.error("🛑 Cannot verify target channel: Client not connected.")
-            return False
+    """Verifies access to the default target channel and every routed one."""
+    targets = route_table.all_targets()
+    if not targets:
+        # No target channel configured, which is valid.
+        return True
+    if not client or not client.is_connected():
+        logger.error("🛑 Cannot verify target channels: Client not connected.")
+        return False
+    verified = True
+    for target_id in targets:
         try:
-            await client.get_entity(TARGET_FORWARD_CHANNEL_ID)
-            logger.info(f"✅ Successfully verified access to target channel {TARGET_FORWARD_CHANNEL_ID}.")
-            return True
+            await client.get_entity(target_id)
+            logger.info(f"✅ Successfully verified access to target channel {target_id}.")
         except Exception as e:
-             logger.error(f"🛑 Could not access target channel {TARGET_FORWARD_CHANNEL_ID}: {e}")
+             logger.error(f"🛑 Could not access target channel {target_id}: {e}")
              logger.error("Please ensure the UserBot account is a member of the target channel and the ID is correct.")
-             return False
-    else:
-        # No target channel configured, which is valid.
-        return True
+             verified = False
+    return verified
 
 async def main():
     """Main function to initialize, connect, and run the bot."""
     logger.info("🚀 Initializing UserBot...")
+    timer = StartupTimer(STARTED_AT)
+    timer.mark("config") # Settings, logging and module imports
+
+    try:
+        schema_version = await run_db(run_migrations)
+        logger.info(f"🗄️ Database schema at version {schema_version}.")
+    except Exception as e:
+        logger.error(f"🛑 Database migration failed: {e}")
+        return
+    timer.mark("migrations")
+    await reload_data()
+    await load_price_index()
+    await load_routes()
+    await entity_cache.load()
+    await high_water_marks.load()
+    timer.mark("data load")
 
     if not await connect_client():
         logger.error("🛑 Client connection failed. Exiting.")
         return
+    timer.mark("client connect")
 
     if not await verify_target_channel():
         logger.warning("Continuing without guaranteed target channel access...")
+    timer.mark("target check")
 
-    client.add_event_handler(main_event_handler)
-    logger.info("✅ Event handler registered.")
+    warm_task = asyncio.create_task(entity_cache.warm(client)) # Fill titles in the background while listening
+    price_writer.start()
+    forwarder.start()
+    source_retention.start()
+    high_water_marks.start()
+    ingest_queue.start(process_queued_message)
+    client.add_event_handler(channel_event_handler, channel_events)
+    if ADMIN_USER_ID != 0:
+        client.add_event_handler(admin_event_handler, admin_events)
+    logger.info("✅ Event handlers registered.")
+    timer.mark("handler registration")
+    timer.report()
+
+    metrics_server = await start_http_server(METRICS_HTTP_HOST, METRICS_HTTP_PORT)
+
+    # Live messages are already being received, so the gap fetch can't miss any
+    catch_up_task = asyncio.create_task(catch_up(client)) if CATCHUP_ENABLED else None
 
     try:
         me = await client.get_me()
@@ -48,7 +128,19 @@ async def main():
 
 
     logger.info("👂 Listening for messages...")
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        warm_task.cancel()
+        if metrics_server:
+            metrics_server.close()
+        if catch_up_task:
+            catch_up_task.cancel()
+        await ingest_queue.stop()
+        await high_water_marks.stop()
+        await source_retention.stop()
+        await forwarder.stop()
+        await price_writer.stop()
 
 
 if __name__ == "__main__":
@@ -59,6 +151,11 @@ if __name__ == "__main__":
         logger.info("\n🛑 Ctrl+C received, shutting down...")
     finally:
         logger.info("🔌 Cleaning up...")
+        loop.run_until_complete(ingest_queue.stop())
+        loop.run_until_complete(high_water_marks.stop())
+        loop.run_until_complete(forwarder.stop())
+        loop.run_until_complete(price_writer.stop())
+        loop.run_until_complete(close_db())
         if client and client.is_connected():
              loop.run_until_complete(disconnect_client())
         loop.close()
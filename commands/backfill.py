@@ -0,0 +1,43 @@
+from backfill import backfill, is_running
+from client_setup import client
+from config import logger
+
+BACKFILL_MAX_DAYS = 365
+
+
+async def handle_backfill(event, args):
+    """Handles the /backfill command."""
+    parts = args.split()
+    if len(parts) != 2 or not (parts[0] == "all" or parts[0].isdigit()) or not parts[1].isdigit():
+        await event.reply("❌ Usage: `/backfill <product_id|all> <days>`")
+        return
+    product_id = None if parts[0] == "all" else int(parts[0])
+    days = int(parts[1])
+    if not 1 <= days <= BACKFILL_MAX_DAYS:
+        await event.reply(f"❌ Days must be between 1 and {BACKFILL_MAX_DAYS}.")
+        return
+    if is_running():
+        await event.reply("⏳ A backfill is already running, try again when it finishes.")
+        return
+
+    await event.reply(f"📚 Backfilling {parts[0]} over the last {days} days, this may take a while...")
+    try:
+        results = await backfill(client, product_id, days)
+    except ValueError as e:
+        await event.reply(f"❌ {e}.")
+        return
+    except Exception as e:
+        logger.error(f"Error running backfill: {e}")
+        await event.reply(f"⚠️ Error running backfill: {e}")
+        return
+
+    messages = sum(result.messages for result in results)
+    records = sum(result.records for result in results)
+    reply = f"✅ Backfill done: {records} price records from {messages} messages in {len(results)} channels."
+    failed = [result for result in results if result.error]
+    if failed:
+        reply += "\n\n⚠️ Stopped early (run again to resume):\n" + "\n".join(
+            f"- `{result.chat_id}`: {result.error}" for result in failed
+        )
+    await event.reply(reply)
+    logger.info(f"Admin {event.sender_id} backfilled {parts[0]} over {days} days.")
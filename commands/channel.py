@@ -1,10 +1,18 @@
 import re
 import sqlite3
 
-from client_setup import client  # Need the client for get_entity and get_dialogs
+import data_manager
+from client_setup import client  # Needed to resolve channel titles and dialogs
 from config import logger
-from data_manager import get_whitelisted_channels, load_data
-from db.db import add_whitelisted_channel, delete_whitelisted_channel
+from db.async_db import (
+    add_whitelisted_channel,
+    delete_whitelisted_channel,
+    list_whitelisted_channels,
+)
+from entity_cache import entity_cache
+
+MESSAGE_CHUNK_LIMIT = 4090 # Telegram message length limit (4096) with some margin
+LIST_FILTER_MODES = ("all", "whitelisted", "unwhitelisted")
 
 
 async def handle_add_channel(event, channel_id_str):
@@ -15,18 +23,17 @@ async def handle_add_channel(event, channel_id_str):
     try:
         channel_id = int(channel_id_str)
         channel_name = f"ID {channel_id}"
-        try:
-            if client and client.is_connected():
-                 entity = await client.get_entity(channel_id)
-                 channel_name = getattr(entity, 'title', channel_name)
+        if client and client.is_connected():
+            title = await entity_cache.resolve_title(client, channel_id)
+            if title:
+                channel_name = title
             else:
-                logger.warning("Client not connected, cannot fetch channel title during add.")
-        except Exception as e:
-            logger.warning(f"Could not fetch channel title for {channel_id}: {e}")
-            await event.reply(f"⚠️ Warning: Could not verify channel {channel_id}. Added anyway.")
+                await event.reply(f"⚠️ Warning: Could not verify channel {channel_id}. Added anyway.")
+        else:
+            logger.warning("Client not connected, cannot fetch channel title during add.")
 
-        add_whitelisted_channel(channel_id)
-        load_data()
+        await add_whitelisted_channel(channel_id)
+        data_manager.add_channel(channel_id)
         await event.reply(f"✅ Channel '{channel_name}' (ID: `{channel_id}`) added to whitelist.")
         logger.info(f"Admin {event.sender_id} added channel: {channel_id}")
     except sqlite3.IntegrityError:
@@ -38,8 +45,7 @@ async def handle_add_channel(event, channel_id_str):
 async def handle_list_channels(event):
     """Handles the /list_channels command."""
     try:
-        from db.db import list_whitelisted_channels as list_raw_channels
-        raw_channel_ids = list_raw_channels()
+        raw_channel_ids = await list_whitelisted_channels()
     except Exception as e:
         logger.error(f"Failed to fetch raw channel list for display: {e}")
         await event.reply("⚠️ Error fetching channel list details.")
@@ -53,19 +59,14 @@ async def handle_list_channels(event):
     channels_to_list = list(raw_channel_ids)
 
     if not client or not client.is_connected():
-        logger.warning("Client not connected, cannot fetch channel titles for list.")
+        logger.warning("Client not connected, listing cached channel titles only.")
         for channel_id in channels_to_list:
-             message += f"- `{channel_id}`: (Name unavailable - client disconnected)\n"
+             name = entity_cache.get_title(channel_id) or "(Name unavailable - client disconnected)"
+             message += f"- `{channel_id}`: {name}\n"
     else:
+        titles = await entity_cache.resolve_titles(client, channels_to_list)
         for channel_id in channels_to_list:
-            name = f"ID {channel_id}"
-            try:
-                entity = await client.get_entity(channel_id)
-                name = getattr(entity, 'title', name)
-            except Exception as e:
-                logger.warning(f"Could not fetch title for channel {channel_id} during list: {e}")
-                pass
-            message += f"- `{channel_id}`: {name}\n"
+            message += f"- `{channel_id}`: {titles[channel_id] or f'ID {channel_id}'}\n"
 
     await event.reply(message)
     logger.info(f"Admin {event.sender_id} listed channels.")
@@ -78,63 +79,104 @@ async def handle_del_channel(event, channel_id_str):
         return
     try:
         channel_id = int(channel_id_str)
-        delete_whitelisted_channel(channel_id)
-        load_data()
+        await delete_whitelisted_channel(channel_id)
+        data_manager.remove_channel(channel_id)
         await event.reply(f"✅ Channel ID `{channel_id}` removed from whitelist (if it existed).")
         logger.info(f"Admin {event.sender_id} deleted channel: {channel_id}")
     except Exception as e:
         logger.error(f"Error deleting channel: {e}")
         await event.reply(f"⚠️ Error deleting channel: {e}")
 
-async def handle_list_my_channels(event):
+class ChunkedReply:
+    """
+    Sends lines as replies of at most MESSAGE_CHUNK_LIMIT characters as soon
+    as each one fills up. The first chunk goes out after `first_chunk_lines`
+    lines so the admin sees results while the rest is still being fetched.
+    """
+
+    def __init__(self, event, header: str = "", first_chunk_lines: int = 20):
+        self._event = event
+        self._current = header
+        self._lines_in_current = 0
+        self._first_chunk_lines = first_chunk_lines
+        self._sent = 0
+
+    async def _send(self):
+        await self._event.reply(self._current)
+        self._current = ""
+        self._lines_in_current = 0
+        self._sent += 1
+
+    async def add(self, line: str):
+        if len(self._current) + len(line) + 1 > MESSAGE_CHUNK_LIMIT:
+            await self._send()
+        self._current += line + "\n"
+        self._lines_in_current += 1
+        if self._sent == 0 and self._lines_in_current >= self._first_chunk_lines:
+            await self._send()
+
+    async def close(self, footer: str = ""):
+        if footer:
+            await self.add(footer)
+        if self._current:
+            await self._send()
+
+
+def _parse_channel_filters(args: str):
+    """Parses '[all|whitelisted|unwhitelisted] [title text]' into (mode, lowercase title filter)."""
+    parts = args.split(maxsplit=1)
+    mode = "all"
+    if parts and parts[0].lower() in LIST_FILTER_MODES:
+        mode = parts.pop(0).lower()
+    return mode, (parts[0].strip().lower() if parts else "")
+
+async def handle_list_my_channels(event, args=""):
     """Handles the /list_my_channels command."""
     if not client or not client.is_connected():
         await event.reply("⚠️ Client is not connected. Cannot fetch channel list.")
         logger.warning("Attempted /list_my_channels while client disconnected.")
         return
 
+    mode, title_filter = _parse_channel_filters(args)
     try:
         await event.reply("🔄 Fetching the UserBot's channel list...")
-        my_channels_output = []
-        dialogs = await client.get_dialogs(limit=None)
-
-        normalized_whitelist = get_whitelisted_channels()
+        reply = ChunkedReply(event, "📢 UserBot account broadcast channels:\n\n")
+        whitelist = data_manager.get_snapshot().whitelisted_channels # Stays the same while the dialogs are fetched
         count = 0
-        for dialog in dialogs:
-            if dialog.is_channel:
-                entity = dialog.entity
 
-                is_broadcast = getattr(entity, 'broadcast', False)
-                is_megagroup = getattr(entity, 'megagroup', False)
-                if is_broadcast and not is_megagroup:
-                    channel_id = entity.id
+        async for dialog in client.iter_dialogs():
+            if not dialog.is_channel:
+                continue
+            entity = dialog.entity
+            entity_cache.put(entity)
 
-                    full_channel_id = int(f"-100{channel_id}") if channel_id > 0 else channel_id
-                    title = getattr(entity, 'title', 'Unknown Channel')
+            is_broadcast = getattr(entity, 'broadcast', False)
+            is_megagroup = getattr(entity, 'megagroup', False)
+            if not is_broadcast or is_megagroup:
+                continue
 
-                    is_whitelisted = full_channel_id in normalized_whitelist or channel_id in normalized_whitelist
-                    mark = "✅" if is_whitelisted else "❌"
-                    my_channels_output.append(f"{mark} `{full_channel_id}`: {title}")
-                    count += 1
+            full_channel_id = dialog.id # Marked peer ID, like the whitelist
+            title = getattr(entity, 'title', 'Unknown Channel')
 
-        if not my_channels_output:
-            await event.reply("🤷 The UserBot account isn't in any broadcast channels.")
-            return
+            is_whitelisted = full_channel_id in whitelist
+            if (mode == "whitelisted" and not is_whitelisted) or (mode == "unwhitelisted" and is_whitelisted):
+                continue
+            if title_filter and title_filter not in title.lower():
+                continue
 
-        response = f"📢 UserBot account is in {count} broadcast channels:\n\n"
-        current_msg = response
-        
-        for line in my_channels_output:
-            if len(current_msg) + len(line) + 1 > 4090: # Telegram message length limit
-                await event.reply(current_msg)
-                current_msg = ""
-            current_msg += line + "\n"
-        # Send the last part
-        if current_msg:
-            await event.reply(current_msg)
+            mark = "✅" if is_whitelisted else "❌"
+            await reply.add(f"{mark} `{full_channel_id}`: {title}")
+            count += 1
+
+        await entity_cache.flush()
+
+        if count == 0:
+            await event.reply("🤷 No broadcast channels of the UserBot account match.")
+            return
+        await reply.close(f"\nTotal: {count} channels.")
 
         logger.info(f"Admin {event.sender_id} listed UserBot's channels.")
 
     except Exception as e:
         logger.error(f"Error handling /list_my_channels: {e}")
-        await event.reply(f"⚠️ Error fetching channel list: {e}")
\ No newline at end of file
+        await event.reply(f"⚠️ Error fetching channel list: {e}")
@@ -1,6 +1,22 @@
-from config import logger
-from data_manager import get_wishlist, load_data
-from db.db import add_product, delete_product
+import sqlite3
+
+import data_manager
+from config import PRICE_WINDOW_DAYS, logger
+from db.async_db import (
+    add_product,
+    delete_product,
+    get_daily_prices,
+    get_lowest_price,
+    get_price_stats,
+    set_drop_percent,
+    set_target_price,
+)
+from price_index import price_index
+from routes import route_table
+
+HISTORY_DEFAULT_DAYS = 30
+HISTORY_MAX_DAYS = 60 # Keeps the reply under Telegram's message length limit
+STATS_DAYS = 7
 
 
 async def handle_add_product(event, name):
@@ -9,17 +25,19 @@ async def handle_add_product(event, name):
         await event.reply("❌ Usage: `/add_product <product name>`")
         return
     try:
-        add_product(name)
-        load_data()
+        product_id = await add_product(name)
+        data_manager.add_product(product_id, name)
         await event.reply(f"✅ Product '{name}' added.")
         logger.info(f"Admin {event.sender_id} added product: {name}")
+    except sqlite3.IntegrityError:
+        await event.reply(f"⚠️ Product '{name}' is already watched.")
     except Exception as e:
         logger.error(f"Error adding product: {e}")
         await event.reply(f"⚠️ Error adding product: {e}")
 
 async def handle_list_products(event):
     """Handles the /list_products command."""
-    wishlist = get_wishlist()
+    wishlist = data_manager.get_wishlist()
     if not wishlist:
         await event.reply("📭 No products watched.")
         return
@@ -34,13 +52,136 @@ async def handle_del_product(event, product_id_str):
         return
     try:
         product_id = int(product_id_str)
-        deleted_product_name = delete_product(product_id)
+        deleted_product_name = await delete_product(product_id)
         if deleted_product_name:
-            load_data()
+            data_manager.remove_product(product_id)
+            price_index.remove_product(product_id)
+            route_table.remove_product(product_id)
             await event.reply(f"✅ Product '{deleted_product_name}' (ID: {product_id}) deleted.")
             logger.info(f"Admin {event.sender_id} deleted product ID: {product_id}")
         else:
             await event.reply(f"⚠️ Product ID `{product_id}` not found.")
     except Exception as e:
         logger.error(f"Error deleting product: {e}")
-        await event.reply(f"⚠️ Error deleting product: {e}")
\ No newline at end of file
+        await event.reply(f"⚠️ Error deleting product: {e}")
+
+def _product_label(product_id):
+    name = data_manager.get_product_name(product_id)
+    return f"'{name}' (ID: {product_id})" if name else f"ID {product_id}"
+
+async def handle_price_history(event, args):
+    """Handles the /price_history command."""
+    parts = args.split()
+    if not parts or not parts[0].isdigit() or (len(parts) > 1 and not parts[1].isdigit()):
+        await event.reply("❌ Usage: `/price_history <product_id> [days]`")
+        return
+    product_id = int(parts[0])
+    days = min(max(1, int(parts[1])), HISTORY_MAX_DAYS) if len(parts) > 1 else HISTORY_DEFAULT_DAYS
+    try:
+        rows = await get_daily_prices(product_id, days)
+        if not rows:
+            await event.reply(f"📭 No prices recorded for product {_product_label(product_id)} in the last {days} days.")
+            return
+        message = f"📈 Daily prices for {_product_label(product_id)} (min / avg / max):\n" + "\n".join(
+            [f"- {day}: R${low:.2f} / R${avg:.2f} / R${high:.2f} ({count}x)" for day, low, avg, high, count in rows]
+        )
+        await event.reply(message)
+        logger.info(f"Admin {event.sender_id} requested price history for product {product_id}.")
+    except Exception as e:
+        logger.error(f"Error fetching price history: {e}")
+        await event.reply(f"⚠️ Error fetching price history: {e}")
+
+async def handle_lowest(event, product_id_str):
+    """Handles the /lowest command."""
+    if not product_id_str or not product_id_str.isdigit():
+        await event.reply("❌ Usage: `/lowest <product_id>`")
+        return
+    product_id = int(product_id_str)
+    try:
+        row = await get_lowest_price(product_id)
+        if row is None:
+            await event.reply(f"📭 No prices recorded for product {_product_label(product_id)}.")
+            return
+        day, price = row
+        await event.reply(f"🏷️ Lowest price for {_product_label(product_id)}: R${price:.2f} on {day}.")
+        logger.info(f"Admin {event.sender_id} requested lowest price for product {product_id}.")
+    except Exception as e:
+        logger.error(f"Error fetching lowest price: {e}")
+        await event.reply(f"⚠️ Error fetching lowest price: {e}")
+
+async def handle_stats(event):
+    """Handles the /stats command."""
+    try:
+        stats = await get_price_stats(STATS_DAYS)
+        message = (
+            "📊 Price Statistics:\n"
+            f"- Watched products: {len(data_manager.get_wishlist())}\n"
+            f"- Products with prices: {stats['priced_products']}\n"
+            f"- Price records: {stats['total_records']} ({stats['recent_records']} in the last {STATS_DAYS} days)\n"
+        )
+        if stats["top_channels"]:
+            message += f"\n📢 Top channels ({STATS_DAYS} days):\n" + "\n".join(
+                [f"- `{peer_id}`: {count} records" for peer_id, count in stats["top_channels"]]
+            )
+        await event.reply(message)
+        logger.info(f"Admin {event.sender_id} requested stats.")
+    except Exception as e:
+        logger.error(f"Error fetching stats: {e}")
+        await event.reply(f"⚠️ Error fetching stats: {e}")
+
+def _parse_threshold(args):
+    """Parses '<product_id> <number|off>' into (product_id, value or None), or None if malformed."""
+    parts = args.split()
+    if len(parts) != 2 or not parts[0].isdigit():
+        return None
+    if parts[1].lower() == "off":
+        return int(parts[0]), None
+    try:
+        value = float(parts[1].replace(",", "."))
+    except ValueError:
+        return None
+    return (int(parts[0]), value) if value > 0 else None
+
+async def handle_set_target(event, args):
+    """Handles the /set_target command."""
+    parsed = _parse_threshold(args)
+    if parsed is None:
+        await event.reply("❌ Usage: `/set_target <product_id> <price|off>`")
+        return
+    product_id, target_price = parsed
+    try:
+        if not await set_target_price(product_id, target_price):
+            await event.reply(f"⚠️ Product ID `{product_id}` not found.")
+            return
+        _, drop_percent = price_index.get_thresholds(product_id)
+        price_index.set_thresholds(product_id, target_price, drop_percent)
+        if target_price is None:
+            await event.reply(f"✅ Target price cleared for {_product_label(product_id)}.")
+        else:
+            await event.reply(f"✅ {_product_label(product_id)} will be forwarded at or below R${target_price:.2f}.")
+        logger.info(f"Admin {event.sender_id} set target price {target_price} for product {product_id}.")
+    except Exception as e:
+        logger.error(f"Error setting target price: {e}")
+        await event.reply(f"⚠️ Error setting target price: {e}")
+
+async def handle_set_drop(event, args):
+    """Handles the /set_drop command."""
+    parsed = _parse_threshold(args)
+    if parsed is None or (parsed[1] is not None and parsed[1] >= 100):
+        await event.reply("❌ Usage: `/set_drop <product_id> <percent|off>` (percent between 0 and 100)")
+        return
+    product_id, drop_percent = parsed
+    try:
+        if not await set_drop_percent(product_id, drop_percent):
+            await event.reply(f"⚠️ Product ID `{product_id}` not found.")
+            return
+        target_price, _ = price_index.get_thresholds(product_id)
+        price_index.set_thresholds(product_id, target_price, drop_percent)
+        if drop_percent is None:
+            await event.reply(f"✅ Price drop alert cleared for {_product_label(product_id)}.")
+        else:
+            await event.reply(f"✅ {_product_label(product_id)} will be forwarded when {drop_percent:g}% below its {PRICE_WINDOW_DAYS}-day minimum.")
+        logger.info(f"Admin {event.sender_id} set drop percent {drop_percent} for product {product_id}.")
+    except Exception as e:
+        logger.error(f"Error setting price drop alert: {e}")
+        await event.reply(f"⚠️ Error setting price drop alert: {e}")
@@ -0,0 +1,136 @@
+import re
+import sqlite3
+
+import data_manager
+from client_setup import client  # Needed to check access to target channels
+from config import TARGET_FORWARD_CHANNEL_ID, logger
+from db.async_db import (
+    add_forward_route,
+    add_product_tag,
+    delete_forward_route,
+    delete_product_tag,
+)
+from entity_cache import entity_cache
+from routes import route_table
+
+TAG_PATTERN = re.compile(r"^#?(\w[\w-]*)$")
+
+
+def _parse_tag(text: str):
+    """Returns a tag ('#phones' or 'phones') lowercased and without '#', or None if invalid."""
+    match = TAG_PATTERN.match(text)
+    return match.group(1).lower() if match else None
+
+def _selector_label(product_id, tag):
+    if tag is not None:
+        return f"#{tag}"
+    name = data_manager.get_product_name(product_id)
+    return f"'{name}' (ID: {product_id})" if name else f"ID {product_id}"
+
+async def handle_tag(event, args):
+    """Handles the /tag command."""
+    parts = args.split()
+    tag = _parse_tag(parts[1]) if len(parts) == 2 else None
+    if not parts or not parts[0].isdigit() or tag is None:
+        await event.reply("❌ Usage: `/tag <product_id> <tag>`")
+        return
+    product_id = int(parts[0])
+    try:
+        if not await add_product_tag(product_id, tag):
+            await event.reply(f"⚠️ Product ID `{product_id}` not found.")
+            return
+        route_table.add_tag(product_id, tag)
+        await event.reply(f"✅ Product {_selector_label(product_id, None)} tagged #{tag}.")
+        logger.info(f"Admin {event.sender_id} tagged product {product_id} with #{tag}")
+    except Exception as e:
+        logger.error(f"Error tagging product: {e}")
+        await event.reply(f"⚠️ Error tagging product: {e}")
+
+async def handle_untag(event, args):
+    """Handles the /untag command."""
+    parts = args.split()
+    tag = _parse_tag(parts[1]) if len(parts) == 2 else None
+    if not parts or not parts[0].isdigit() or tag is None:
+        await event.reply("❌ Usage: `/untag <product_id> <tag>`")
+        return
+    product_id = int(parts[0])
+    try:
+        if not await delete_product_tag(product_id, tag):
+            await event.reply(f"⚠️ Product ID `{product_id}` is not tagged #{tag}.")
+            return
+        route_table.remove_tag(product_id, tag)
+        await event.reply(f"✅ Tag #{tag} removed from product {_selector_label(product_id, None)}.")
+        logger.info(f"Admin {event.sender_id} removed tag #{tag} from product {product_id}")
+    except Exception as e:
+        logger.error(f"Error untagging product: {e}")
+        await event.reply(f"⚠️ Error untagging product: {e}")
+
+async def handle_add_route(event, args):
+    """Handles the /add_route command."""
+    parts = args.split()
+    if len(parts) != 2 or not re.match(r"^-?\d+$", parts[1]):
+        await event.reply("❌ Usage: `/add_route <product_id|#tag> <target_channel_id>`")
+        return
+    selector, target_id = parts[0], int(parts[1])
+    if selector.isdigit():
+        product_id, tag = int(selector), None
+        if data_manager.get_product_name(product_id) is None:
+            await event.reply(f"⚠️ Product ID `{product_id}` not found.")
+            return
+    else:
+        product_id, tag = None, _parse_tag(selector)
+        if tag is None:
+            await event.reply("❌ Usage: `/add_route <product_id|#tag> <target_channel_id>`")
+            return
+    try:
+        target_name = f"ID {target_id}"
+        if client and client.is_connected():
+            title = await entity_cache.resolve_title(client, target_id)
+            if title:
+                target_name = title
+            else:
+                await event.reply(f"⚠️ Warning: Could not verify target channel {target_id}. Added anyway.")
+
+        route_id = await add_forward_route(product_id, tag, target_id)
+        route_table.add_route(route_id, product_id, tag, target_id)
+        await event.reply(f"✅ Route `{route_id}` added: {_selector_label(product_id, tag)} → '{target_name}' (ID: `{target_id}`).")
+        logger.info(f"Admin {event.sender_id} added route {route_id}: {selector} -> {target_id}")
+    except sqlite3.IntegrityError:
+        await event.reply(f"⚠️ {_selector_label(product_id, tag)} is already routed to `{target_id}`.")
+    except Exception as e:
+        logger.error(f"Error adding route: {e}")
+        await event.reply(f"⚠️ Error adding route: {e}")
+
+async def handle_list_routes(event):
+    """Handles the /list_routes command."""
+    routes = route_table.routes()
+    default = f"`{TARGET_FORWARD_CHANNEL_ID}`" if TARGET_FORWARD_CHANNEL_ID else "none (not forwarded)"
+    if not routes:
+        await event.reply(f"📭 No forward routes. Every product goes to the default target: {default}.")
+        return
+    lines = [f"- `{route_id}`: {_selector_label(product_id, tag)} → `{target_id}`" for route_id, product_id, tag, target_id in routes]
+    tagged = [(pid, route_table.get_tags(pid)) for pid, _ in data_manager.get_wishlist()]
+    tag_lines = [f"- {_selector_label(pid, None)}: {' '.join('#' + tag for tag in tags)}" for pid, tags in tagged if tags]
+    message = "🧭 Forward Routes:\n" + "\n".join(lines)
+    if tag_lines:
+        message += "\n\n🏷️ Product Tags:\n" + "\n".join(tag_lines)
+    message += f"\n\nProducts without routes go to the default target: {default}."
+    await event.reply(message)
+    logger.info(f"Admin {event.sender_id} listed routes.")
+
+async def handle_del_route(event, route_id_str):
+    """Handles the /del_route command."""
+    if not route_id_str or not route_id_str.isdigit():
+        await event.reply("❌ Usage: `/del_route <route_id>`")
+        return
+    route_id = int(route_id_str)
+    try:
+        if not await delete_forward_route(route_id):
+            await event.reply(f"⚠️ Route ID `{route_id}` not found.")
+            return
+        route_table.remove_route(route_id)
+        await event.reply(f"✅ Route `{route_id}` deleted.")
+        logger.info(f"Admin {event.sender_id} deleted route {route_id}")
+    except Exception as e:
+        logger.error(f"Error deleting route: {e}")
+        await event.reply(f"⚠️ Error deleting route: {e}")
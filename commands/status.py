@@ -0,0 +1,35 @@
+import metrics
+from config import METRICS_ENABLED, logger
+from dedup import duplicate_cache
+from handlers.forwarder import forwarder
+from handlers.ingest_queue import ingest_queue
+
+_worker_count = 0 # Supervisor mode: ingestion and matching run in this many worker processes
+
+
+def set_worker_count(count: int):
+    """Marks the stats as the supervisor's own, with ingestion and matching in `count` worker processes."""
+    global _worker_count
+    _worker_count = count
+
+def _supervisor_note() -> str:
+    if not _worker_count:
+        return ""
+    return f"ℹ️ Supervisor process only: ingestion and matching run in {_worker_count} worker processes, whose counters are not included.\n\n"
+
+async def handle_queue_stats(event):
+    """Handles the /queue_stats command."""
+    stats = ingest_queue.stats()
+    message = _supervisor_note() + "📊 Ingestion Queue:\n" + "\n".join([f"- {key}: `{value}`" for key, value in stats.items()])
+    message += "\n\n📤 Forward Scheduler:\n" + "\n".join([f"- {key}: `{value}`" for key, value in forwarder.stats().items()])
+    message += "\n\n♻️ Dedup Cache:\n" + "\n".join([f"- {key}: `{value}`" for key, value in duplicate_cache.stats().items()])
+    await event.reply(message)
+    logger.info(f"Admin {event.sender_id} requested queue stats.")
+
+async def handle_metrics(event):
+    """Handles the /metrics command."""
+    if not METRICS_ENABLED:
+        await event.reply("⚠️ Metrics are disabled (set `METRICS_ENABLED=1` to enable them).")
+        return
+    await event.reply(_supervisor_note() + metrics.format_summary())
+    logger.info(f"Admin {event.sender_id} requested metrics.")
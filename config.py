@@ -1,8 +1,13 @@
 import logging
 import os
+import time
 
 from dotenv import load_dotenv
 
+from logging_setup import setup_logging
+
+STARTED_AT = time.perf_counter() # Start of configuration loading, for the startup timing report
+
 load_dotenv()
 
 API_ID = int(os.getenv('API_ID', 0))
@@ -11,9 +16,71 @@ API_HASH = os.getenv('API_HASH', '')
 STRING_SESSION = os.getenv('STRING_SESSION', '') # String session for the bot
 
 ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', 0)) # User ID of the admin controlling the bot
-TARGET_FORWARD_CHANNEL_ID = int(os.getenv('TARGET_FORWARD_CHANNEL_ID', 0)) # Channel ID to forward messages to
+TARGET_FORWARD_CHANNEL_ID = int(os.getenv('TARGET_FORWARD_CHANNEL_ID', 0)) # Channel ID to forward products without a route (/add_route) to
+
+PRICE_WRITE_FLUSH_MS = int(os.getenv('PRICE_WRITE_FLUSH_MS', 500)) # Max delay before buffered price records are written
+PRICE_WRITE_BATCH_SIZE = int(os.getenv('PRICE_WRITE_BATCH_SIZE', 200)) # Buffered price records that trigger an early write
+SOURCE_RETENTION_DAYS = int(os.getenv('SOURCE_RETENTION_DAYS', 90)) # Days promo texts are kept for price records (0 keeps them forever)
+RETENTION_INTERVAL_HOURS = float(os.getenv('RETENTION_INTERVAL_HOURS', 24)) # Hours between retention runs
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 500)) # Source messages checked per retention transaction
+VACUUM_PAGES_PER_STEP = int(os.getenv('VACUUM_PAGES_PER_STEP', 256)) # Free pages released per incremental vacuum step
+
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 1000)) # Max channel messages waiting for a worker
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 4)) # Concurrent promo processing workers
+INGEST_OVERFLOW_POLICY = os.getenv('INGEST_OVERFLOW_POLICY', 'drop_oldest') # block, drop_newest or drop_oldest
+INGEST_STATS_INTERVAL = int(os.getenv('INGEST_STATS_INTERVAL', 60)) # Seconds between queue stats log lines (0 disables)
+
+FORWARD_RATE = float(os.getenv('FORWARD_RATE', 0.5)) # Average forward/send API calls per second
+FORWARD_BURST = int(os.getenv('FORWARD_BURST', 5)) # API calls allowed back to back before rate limiting kicks in
+FORWARD_BATCH_SIZE = int(os.getenv('FORWARD_BATCH_SIZE', 100)) # Messages from one source per forward call (Telegram max 100)
+FORWARD_BATCH_WINDOW_MS = int(os.getenv('FORWARD_BATCH_WINDOW_MS', 250)) # Wait after an idle period so a burst is batched together
+FORWARD_MAX_ATTEMPTS = int(os.getenv('FORWARD_MAX_ATTEMPTS', 3)) # Attempts per message on unexpected errors
+FORWARD_QUEUE_SIZE = int(os.getenv('FORWARD_QUEUE_SIZE', 5000)) # Max messages waiting to be sent
+
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', '1') == '1' # Suppress promos reposted by several channels
+DEDUP_CACHE_SIZE = int(os.getenv('DEDUP_CACHE_SIZE', 5000)) # Recent promos remembered for duplicate detection
+DEDUP_WINDOW_SECONDS = int(os.getenv('DEDUP_WINDOW_SECONDS', 1800)) # How long a promo suppresses its reposts
+DEDUP_SIMHASH_DISTANCE = int(os.getenv('DEDUP_SIMHASH_DISTANCE', 6)) # Max differing SimHash bits (of 64) for a near-duplicate
+DEDUP_LOG_EVERY = int(os.getenv('DEDUP_LOG_EVERY', 500)) # Log dedup hit rate every N checks (0 disables)
+
+PRICE_WINDOW_DAYS = int(os.getenv('PRICE_WINDOW_DAYS', 30)) # Days of minimum prices kept for drop alerts
+
+ENTITY_CACHE_TTL = int(os.getenv('ENTITY_CACHE_TTL', 86400)) # Seconds before a cached channel title is refreshed
+ENTITY_RESOLVE_CONCURRENCY = int(os.getenv('ENTITY_RESOLVE_CONCURRENCY', 5)) # Parallel get_entity calls for cache misses
+
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', 3)) # Channels whose history is fetched at the same time
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', 500)) # Messages processed between checkpoint saves
+
+CATCHUP_ENABLED = os.getenv('CATCHUP_ENABLED', '1') == '1' # Process messages posted while the bot was offline
+CATCHUP_MAX_MESSAGES = int(os.getenv('CATCHUP_MAX_MESSAGES', 500)) # Max missed messages fetched per channel
+CATCHUP_CONCURRENCY = int(os.getenv('CATCHUP_CONCURRENCY', 5)) # Channels fetched at the same time when catching up
+HIGH_WATER_FLUSH_SECONDS = int(os.getenv('HIGH_WATER_FLUSH_SECONDS', 5)) # Max delay before processed message IDs are saved
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1' # Count and time every pipeline stage (/metrics)
+METRICS_HTTP_HOST = os.getenv('METRICS_HTTP_HOST', '127.0.0.1') # Interface the Prometheus endpoint binds to
+METRICS_HTTP_PORT = int(os.getenv('METRICS_HTTP_PORT', 0)) # Port of the Prometheus endpoint (0 disables it)
+
+MATCH_MODE = os.getenv('MATCH_MODE', 'exact') # exact (whole words) or normalized (accents, units, synonyms, negative keywords)
+SYNONYMS_FILE = os.getenv('SYNONYMS_FILE', '') # 'canonical: variant, variant' per line, used in normalized mode
+NEGATIVE_KEYWORDS = [word for word in os.getenv('NEGATIVE_KEYWORDS', '').split(',') if word.strip()] # e.g. capa,película (normalized mode)
+MATCHER_SNAPSHOT_FILE = os.getenv('MATCHER_SNAPSHOT_FILE', 'matcher_snapshot.bin') # Prebuilt wishlist/whitelist for fast starts ('' disables)
+
+WORKER_SESSIONS = [session for session in os.getenv('WORKER_SESSIONS', '').split(',') if session.strip()] # String sessions of the supervisor's worker accounts
+HASH_RING_REPLICAS = int(os.getenv('HASH_RING_REPLICAS', 100)) # Points per worker on the channel partitioning ring
+WORKER_RESTART_DELAY = int(os.getenv('WORKER_RESTART_DELAY', 10)) # Seconds before a crashed worker process is restarted
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO') # DEBUG, INFO, WARNING or ERROR
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text') # text, or json for one structured object per line
+LOG_ASYNC = os.getenv('LOG_ASYNC', '1') == '1' # Format and write log lines on a background thread
+LOG_SAMPLE_NEW_MESSAGE = int(os.getenv('LOG_SAMPLE_NEW_MESSAGE', 1)) # Log 1 of every N "New message" lines
+LOG_SAMPLE_NO_PRICE = int(os.getenv('LOG_SAMPLE_NO_PRICE', 1)) # Log 1 of every N "no price extracted" lines
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+setup_logging(
+    level=LOG_LEVEL.upper(),
+    log_format=LOG_FORMAT,
+    use_queue=LOG_ASYNC,
+    sample_rates={"new_message": LOG_SAMPLE_NEW_MESSAGE, "no_price": LOG_SAMPLE_NO_PRICE},
+)
 logger = logging.getLogger(__name__)
 
 if not STRING_SESSION:
@@ -30,6 +97,6 @@ else:
     logger.info(f"🔑 Bot will accept commands from Admin User ID: {ADMIN_USER_ID}")
 
 if TARGET_FORWARD_CHANNEL_ID == 0:
-    logger.warning("⚠️ TARGET_FORWARD_CHANNEL_ID is not set. Message forwarding will be disabled.")
+    logger.warning("⚠️ TARGET_FORWARD_CHANNEL_ID is not set. Only products with a forward route will be forwarded.")
 else:
-    logger.info(f"📲 Bot will forward found promotions to Channel ID: {TARGET_FORWARD_CHANNEL_ID}")
\ No newline at end of file
+    logger.info(f"📲 Bot will forward found promotions without a route to Channel ID: {TARGET_FORWARD_CHANNEL_ID}")
\ No newline at end of file
@@ -1,45 +1,211 @@
-from config import logger
+import asyncio
+from typing import NamedTuple
+
+from config import (
+    MATCH_MODE,
+    MATCHER_SNAPSHOT_FILE,
+    NEGATIVE_KEYWORDS,
+    SYNONYMS_FILE,
+    logger,
+)
+from db import async_db
 from db.db import list_products, list_whitelisted_channels
+from matcher import NormalizedMatcher, WishlistMatcher, load_synonyms
+from matcher_snapshot import fingerprint, load_snapshot, save_snapshot
+from peer_ids import whitelist_peer_ids
+
+
+def _load_synonyms():
+    if MATCH_MODE != "normalized" or not SYNONYMS_FILE:
+        return {}
+    try:
+        synonyms = load_synonyms(SYNONYMS_FILE)
+    except OSError as e:
+        logger.error(f"⚠️ Could not read synonyms file {SYNONYMS_FILE}: {e}")
+        return {}
+    logger.info(f"🔤 Loaded {len(synonyms)} synonyms from {SYNONYMS_FILE}.")
+    return synonyms
+
+def new_matcher(wishlist=()):
+    """Builds the matcher for the configured MATCH_MODE."""
+    if MATCH_MODE == "normalized":
+        return NormalizedMatcher(wishlist, _synonyms, NEGATIVE_KEYWORDS)
+    return WishlistMatcher(wishlist)
+
+
+# The in-memory state is only mutated on the event loop thread and every
+# mutation completes without awaiting, so coroutines always observe a
+# consistent state. Readers that need a stable copy across awaits (or from
+# another thread) use get_snapshot().
+_synonyms = _load_synonyms() # Normalized matching mode only
+_settings = fingerprint(MATCH_MODE, sorted(_synonyms.items()), NEGATIVE_KEYWORDS) # What else the matcher is built from
+_products = {}          # product_id -> name, in wishlist order
+_matcher = new_matcher()
+_raw_channels = set()   # Channel IDs as stored in the database
+_channel_refs = {}      # Marked peer ID -> number of raw IDs producing it
+_version = 0
+_snapshot = None
+_whitelist_listeners = []
+_change_listeners = []
+_save_task = None       # Background matcher snapshot write
+
+
+class DataSnapshot(NamedTuple):
+    version: int
+    wishlist: tuple          # ((product_id, name), ...)
+    whitelisted_channels: frozenset
+
+
+def add_whitelist_listener(listener):
+    """Registers a function called (without arguments) every time the whitelist changes."""
+    _whitelist_listeners.append(listener)
+
+def add_change_listener(listener):
+    """Registers a function called (without arguments) every time the wishlist or whitelist changes."""
+    _change_listeners.append(listener)
+
+def _notify_whitelist():
+    for listener in _whitelist_listeners:
+        listener()
+
+def _bump_version():
+    global _version, _snapshot
+    _version += 1
+    _snapshot = None
+    for listener in _change_listeners:
+        listener()
+
+def _build_state(wishlist, raw_channels):
+    """Returns the (products, matcher, raw channels, peer ID refs) for the given rows."""
+    products = dict(wishlist)
+    matcher = new_matcher(wishlist)
+    raw = set(cid[0] if isinstance(cid, tuple) else cid for cid in raw_channels)
+    refs = {}
+    for cid in raw:
+        for form in whitelist_peer_ids(cid):
+            refs[form] = refs.get(form, 0) + 1
+    return products, matcher, raw, refs
+
+def _install_state(state):
+    global _products, _matcher, _raw_channels, _channel_refs
+    _products, _matcher, _raw_channels, _channel_refs = state
+    _bump_version()
+    _notify_whitelist()
 
-_wishlist = []
-_whitelisted_channels = set()
+    logger.info(f"🛒 Wishlist loaded: {len(_products)} items.")
+    logger.info(f"📢 Whitelist loaded: {len(_channel_refs)} peer IDs.")
+
+def _apply_data(wishlist, raw_channels):
+    """Rebuilds the in-memory wishlist, matcher and whitelist."""
+    state = _build_state(wishlist, raw_channels)
+    _install_state(state)
+    return state
+
+def _on_load_error(e):
+    logger.error(f"⚠️ Error loading data from DB: {e}")
+    logger.error("Ensure products.db exists and db/initdb.py has been run.")
+    _apply_data([], [])
 
 def load_data():
     """Loads or reloads wishlist and whitelisted channels from the database."""
-    global _wishlist, _whitelisted_channels
     logger.info("🔄 Loading data from database...")
     try:
-        _wishlist = list_products()
-        raw_channels = list_whitelisted_channels()
-        _whitelisted_channels = set(cid[0] if isinstance(cid, tuple) else cid for cid in raw_channels)
-
-        normalized_set = set()
-        for cid in _whitelisted_channels:
-             normalized_set.add(cid)
-             if cid > 0:
-                 normalized_set.add(int(f"-100{cid}"))
-             elif str(cid).startswith("-100"):
-                 normalized_set.add(int(str(cid)[4:]))
-        _whitelisted_channels = normalized_set
-
-        logger.info(f"🛒 Wishlist loaded: {len(_wishlist)} items.")
-        logger.info(f"📢 Whitelist loaded: {len(_whitelisted_channels)} normalized channel IDs.")
+        _apply_data(list_products(), list_whitelisted_channels())
+    except Exception as e:
+        _on_load_error(e)
+
+def _save_snapshot(data_version: int, state):
+    try:
+        save_snapshot(MATCHER_SNAPSHOT_FILE, data_version, _settings, state)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not write matcher snapshot {MATCHER_SNAPSHOT_FILE}: {e}")
+
+async def reload_data():
+    """
+    Like load_data(), but reads the database on the DB thread instead of the
+    event loop. When the database hasn't changed since the matcher snapshot
+    was written, the snapshot is loaded instead of rebuilding the matcher.
+    """
+    logger.info("🔄 Reloading data from database...")
+    try:
+        # Read before the data: a change in between only makes the snapshot stale
+        data_version = await async_db.get_data_version()
+        if MATCHER_SNAPSHOT_FILE:
+            state = await asyncio.to_thread(load_snapshot, MATCHER_SNAPSHOT_FILE, data_version, _settings)
+            if state is not None:
+                logger.info(f"⚡ Matcher snapshot {MATCHER_SNAPSHOT_FILE} is current, skipping the rebuild.")
+                _install_state(state)
+                return
+        wishlist = await async_db.list_products()
+        raw_channels = await async_db.list_whitelisted_channels()
     except Exception as e:
-        logger.error(f"⚠️ Error loading data from DB: {e}")
-        logger.error("Ensure products.db exists and db/initdb.py has been run.")
-        _wishlist = []
-        _whitelisted_channels = set()
+        _on_load_error(e)
+        return
+    state = _apply_data(wishlist, raw_channels)
+    if MATCHER_SNAPSHOT_FILE:
+        # Written in the background. Any later change bumps the data version,
+        # so a snapshot that races with one is stale rather than wrong
+        global _save_task
+        _save_task = asyncio.create_task(asyncio.to_thread(_save_snapshot, data_version, state))
+
+def add_product(product_id, name):
+    """Adds a product to the in-memory wishlist and matcher."""
+    _products[product_id] = name
+    _matcher.add_product(product_id, name)
+    _bump_version()
+
+def remove_product(product_id):
+    """Removes a product from the in-memory wishlist and matcher."""
+    if _products.pop(product_id, None) is not None:
+        _matcher.remove_product(product_id)
+        _bump_version()
+
+def add_channel(channel_id):
+    """Adds a raw channel ID (and the peer IDs it stands for) to the in-memory whitelist."""
+    if channel_id in _raw_channels:
+        return
+    _raw_channels.add(channel_id)
+    for form in whitelist_peer_ids(channel_id):
+        _channel_refs[form] = _channel_refs.get(form, 0) + 1
+    _bump_version()
+    _notify_whitelist()
+
+def remove_channel(channel_id):
+    """Removes a raw channel ID from the in-memory whitelist."""
+    if channel_id not in _raw_channels:
+        return
+    _raw_channels.discard(channel_id)
+    for form in whitelist_peer_ids(channel_id):
+        if _channel_refs.get(form, 0) <= 1:
+            _channel_refs.pop(form, None)
+        else:
+            _channel_refs[form] -= 1
+    _bump_version()
+    _notify_whitelist()
 
 def get_wishlist():
-    """Returns the currently loaded wishlist."""
-    return list(_wishlist)
+    """Returns a read-only, live view of the wishlist as (id, name) pairs."""
+    return _products.items()
+
+def get_product_name(product_id):
+    """Returns the name of a watched product, or None."""
+    return _products.get(product_id)
 
 def get_whitelisted_channels():
-    """Returns the set of currently loaded and normalized whitelisted channel IDs."""
-    return set(_whitelisted_channels)
+    """Returns a read-only, live view of the whitelisted (marked) peer IDs."""
+    return _channel_refs.keys()
 
-def is_channel_whitelisted(channel_id):
-    """Checks if a given channel ID is in the normalized whitelist."""
-    return channel_id in _whitelisted_channels
+def get_snapshot():
+    """Returns an immutable copy of the current data, built at most once per version."""
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = DataSnapshot(_version, tuple(_products.items()), frozenset(_channel_refs))
+    return _snapshot
 
-load_data()
\ No newline at end of file
+def find_matching_products(text):
+    """Returns the (id, name) of every wishlist product matching the text, in wishlist order."""
+    return [(product_id, _products[product_id]) for product_id in _matcher.match(text)]
+
+def is_channel_whitelisted(channel_id):
+    """Checks if a marked peer ID (as in event.chat_id) is whitelisted."""
+    return channel_id in _channel_refs
@@ -0,0 +1,109 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from db import db
+
+# A single thread owns all database work, so writes are serialized and the
+# event loop never waits on SQLite.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+async def run_db(func, *args, **kwargs):
+    """Runs a blocking database function on the DB thread and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+async def add_product(name: str):
+    return await run_db(db.add_product, name)
+
+async def list_products():
+    return await run_db(db.list_products)
+
+async def delete_product(id: int):
+    return await run_db(db.delete_product, id)
+
+async def set_target_price(product_id: int, target_price):
+    return await run_db(db.set_target_price, product_id, target_price)
+
+async def set_drop_percent(product_id: int, drop_percent):
+    return await run_db(db.set_drop_percent, product_id, drop_percent)
+
+async def list_price_thresholds():
+    return await run_db(db.list_price_thresholds)
+
+async def add_price_records(records):
+    return await run_db(db.add_price_records, records)
+
+async def prune_source_messages(days: int, after_id: int, batch_size: int):
+    return await run_db(db.prune_source_messages, days, after_id, batch_size)
+
+async def uses_incremental_vacuum():
+    return await run_db(db.uses_incremental_vacuum)
+
+async def incremental_vacuum(pages: int):
+    return await run_db(db.incremental_vacuum, pages)
+
+async def get_backfill_checkpoints(scope: str):
+    return await run_db(db.get_backfill_checkpoints, scope)
+
+async def save_backfill_batch(records, peer_id: int, scope: str, since: str, last_message_id: int):
+    return await run_db(db.save_backfill_batch, records, peer_id, scope, since, last_message_id)
+
+async def list_high_water_marks():
+    return await run_db(db.list_high_water_marks)
+
+async def save_high_water_marks(rows):
+    return await run_db(db.save_high_water_marks, rows)
+
+async def list_product_tags():
+    return await run_db(db.list_product_tags)
+
+async def add_product_tag(product_id: int, tag: str):
+    return await run_db(db.add_product_tag, product_id, tag)
+
+async def delete_product_tag(product_id: int, tag: str):
+    return await run_db(db.delete_product_tag, product_id, tag)
+
+async def list_forward_routes():
+    return await run_db(db.list_forward_routes)
+
+async def add_forward_route(product_id, tag, target_id: int):
+    return await run_db(db.add_forward_route, product_id, tag, target_id)
+
+async def delete_forward_route(route_id: int):
+    return await run_db(db.delete_forward_route, route_id)
+
+async def get_data_version():
+    return await run_db(db.get_data_version)
+
+async def add_whitelisted_channel(channel_id: int):
+    return await run_db(db.add_whitelisted_channel, channel_id)
+
+async def delete_whitelisted_channel(channel_id: int):
+    return await run_db(db.delete_whitelisted_channel, channel_id)
+
+async def list_whitelisted_channels():
+    return await run_db(db.list_whitelisted_channels)
+
+async def get_daily_prices(product_id: int, days: int):
+    return await run_db(db.get_daily_prices, product_id, days)
+
+async def get_recent_daily_mins(days: int):
+    return await run_db(db.get_recent_daily_mins, days)
+
+async def get_lowest_price(product_id: int):
+    return await run_db(db.get_lowest_price, product_id)
+
+async def get_price_stats(days: int):
+    return await run_db(db.get_price_stats, days)
+
+async def list_cached_entities():
+    return await run_db(db.list_cached_entities)
+
+async def upsert_cached_entities(rows):
+    return await run_db(db.upsert_cached_entities, rows)
+
+async def close_db():
+    """Closes the connection on the DB thread and stops the executor."""
+    await run_db(db.close_connection)
+    _executor.shutdown(wait=True)
@@ -1,72 +1,416 @@
+import hashlib
 import sqlite3
+import threading
+import zlib
 
 DB_PATH = "products.db"
 
+_connection = None
+_lock = threading.RLock()
+_channel_keys = {} # peer ID -> channels.id
+
+_RAISE_HIGH_WATER_MARK = """
+    INSERT INTO high_water_marks (peer_id, last_message_id) VALUES (?, ?)
+    ON CONFLICT (peer_id) DO UPDATE SET
+        last_message_id = MAX(last_message_id, excluded.last_message_id),
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+def get_connection():
+    """Returns the shared database connection, opening it on first use."""
+    global _connection
+    with _lock:
+        if _connection is None:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL") # Only applies to a new database, see enable_incremental_vacuum()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # WAL stays consistent without an fsync on every commit
+            _connection = conn
+        return _connection
+
+def close_connection():
+    """Closes the shared database connection, if open."""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+            _channel_keys.clear()
+
 def add_product(name: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO watched_products (name) VALUES (?)", (name,))
-    conn.commit()
-    conn.close()
+    with _lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute("INSERT INTO watched_products (name) VALUES (?)", (name,))
     print(f"Product '{name}' added.")
+    return cursor.lastrowid
 
 def list_products():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM watched_products")
-    products = cursor.fetchall()
-    conn.close()
+    with _lock:
+        conn = get_connection()
+        products = conn.execute("SELECT id, name FROM watched_products").fetchall()
     return products
 
 def delete_product(id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM watched_products WHERE id = ?", (id,))
-    row = cursor.fetchone()
-
-    if row is None:
-        conn.close()
-        return None
-
-    product_name = row[0]
-    cursor.execute("DELETE FROM watched_products WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with _lock:
+        conn = get_connection()
+        with conn:
+            row = conn.execute("SELECT name FROM watched_products WHERE id = ?", (id,)).fetchone()
+            if row is None:
+                return None
+
+            product_name = row[0]
+            conn.execute("DELETE FROM forward_routes WHERE product_id = ?", (id,))
+            conn.execute("DELETE FROM product_tags WHERE product_id = ?", (id,))
+            conn.execute("DELETE FROM watched_products WHERE id = ?", (id,))
     return product_name
 
-def add_price_record(product_id: int, price: float, currency: str, source_msg: str, channel: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO price_history (product_id, price, currency, source_msg, channel)
-        VALUES (?, ?, ?, ?, ?)
-    """, (product_id, price, currency, source_msg, channel))
-    conn.commit()
-    conn.close()
+def set_target_price(product_id: int, target_price):
+    """Sets (or clears, with None) a product's target price. Returns False if the product doesn't exist."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute("UPDATE watched_products SET target_price = ? WHERE id = ?", (target_price, product_id))
+    return cursor.rowcount > 0
+
+def set_drop_percent(product_id: int, drop_percent):
+    """Sets (or clears, with None) a product's drop-below-minimum percentage. Returns False if the product doesn't exist."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute("UPDATE watched_products SET drop_percent = ? WHERE id = ?", (drop_percent, product_id))
+    return cursor.rowcount > 0
+
+def list_price_thresholds():
+    """Returns (product_id, target_price, drop_percent) for products with any threshold set."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute("""
+            SELECT id, target_price, drop_percent FROM watched_products
+            WHERE target_price IS NOT NULL OR drop_percent IS NOT NULL
+        """).fetchall()
+    return rows
+
+def add_price_record(product_id: int, price: float, currency: str, source_msg: str, channel: str, message_id=None):
+    add_price_records([(product_id, price, currency, source_msg, channel, message_id)])
     print(f"Price {price} {currency} for product {product_id} added.")
 
+def _source_message_ids(conn, texts) -> dict:
+    """
+    Returns {text: source_messages.id}, storing each text not seen before
+    once, zlib-compressed, under the hash of its content.
+    """
+    ids = {}
+    for text in set(texts):
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        row = conn.execute("SELECT id FROM source_messages WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            cursor = conn.execute(
+                "INSERT INTO source_messages (hash, body) VALUES (?, ?)", (digest, zlib.compress(text.encode()))
+            )
+            ids[text] = cursor.lastrowid
+        else:
+            ids[text] = row[0]
+    return ids
+
+def prune_source_messages(days: int, after_id: int, batch_size: int):
+    """
+    Scans up to `batch_size` source messages with an ID above `after_id` and
+    deletes those no price record from the last `days` days refers to; the
+    older records keep their price and lose the text. Returns (last scanned
+    ID or None when done, messages deleted).
+    """
+    with _lock:
+        conn = get_connection()
+        with conn:
+            rows = conn.execute("""
+                SELECT s.id, NOT EXISTS (
+                    SELECT 1 FROM price_history h WHERE h.source_msg_id = s.id AND h.created_at >= datetime('now', ?)
+                )
+                FROM source_messages s WHERE s.id > ? ORDER BY s.id LIMIT ?
+            """, (f"-{days} days", after_id, batch_size)).fetchall()
+            expired = [(message_id,) for message_id, unused in rows if unused]
+            conn.executemany("UPDATE price_history SET source_msg_id = NULL WHERE source_msg_id = ?", expired)
+            conn.executemany("DELETE FROM source_messages WHERE id = ?", expired)
+    last_id = rows[-1][0] if len(rows) == batch_size else None
+    return last_id, len(expired)
+
+def uses_incremental_vacuum() -> bool:
+    """Returns True if the database is in incremental auto-vacuum mode."""
+    with _lock:
+        conn = get_connection()
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2 # INCREMENTAL
+
+def enable_incremental_vacuum() -> bool:
+    """
+    Switches a database created without incremental auto-vacuum to it, which
+    takes one full VACUUM: run it offline (db/initdb.py --incremental-vacuum),
+    never while the bot is running. Returns True if the switch was made.
+    """
+    with _lock:
+        conn = get_connection()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2: # INCREMENTAL
+            return False
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    return True
+
+def incremental_vacuum(pages: int) -> int:
+    """Returns up to `pages` free pages to the file system. Returns the number of free pages left."""
+    with _lock:
+        conn = get_connection()
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def _channel_key(conn, peer_id: int) -> int:
+    """Returns the channels.id for a peer ID, creating the row on first use."""
+    key = _channel_keys.get(peer_id)
+    if key is None:
+        conn.execute("INSERT OR IGNORE INTO channels (peer_id) VALUES (?)", (peer_id,))
+        key = conn.execute("SELECT id FROM channels WHERE peer_id = ?", (peer_id,)).fetchone()[0]
+        _channel_keys[peer_id] = key
+    return key
+
+def add_price_records(records):
+    """
+    Inserts (product_id, price, currency, source_msg, channel, message_id)
+    rows in a single transaction. A product already recorded from the same
+    message is skipped. The high-water mark of every source is raised to its
+    newest message in the same transaction, so catch-up never fetches a
+    recorded message again. Returns the number of rows inserted.
+    """
+    with _lock:
+        conn = get_connection()
+        try:
+            with conn:
+                message_ids = _source_message_ids(conn, [record[3] for record in records if record[3]])
+                rows = [
+                    (product_id, price, currency, message_ids.get(source_msg), _channel_key(conn, int(channel)), message_id)
+                    for product_id, price, currency, source_msg, channel, message_id in records
+                ]
+                cursor = conn.executemany("""
+                    INSERT OR IGNORE INTO price_history (product_id, price, currency, source_msg_id, channel_id, message_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, rows)
+                marks = {}
+                for _, _, _, _, channel, message_id in records:
+                    if message_id is not None:
+                        marks[int(channel)] = max(marks.get(int(channel), 0), message_id)
+                conn.executemany(_RAISE_HIGH_WATER_MARK, marks.items())
+        except Exception:
+            _channel_keys.clear() # Keys created in the rolled back transaction are gone
+            raise
+    return cursor.rowcount
+
+def get_backfill_checkpoints(scope: str):
+    """Returns {peer_id: (since, last_message_id)} for a backfill scope."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute(
+            "SELECT peer_id, since, last_message_id FROM backfill_checkpoints WHERE scope = ?", (scope,)
+        ).fetchall()
+    return {peer_id: (since, last_message_id) for peer_id, since, last_message_id in rows}
+
+def save_backfill_batch(records, peer_id: int, scope: str, since: str, last_message_id: int):
+    """
+    Inserts backfilled (product_id, price, currency, source_msg, channel,
+    message_id, created_at) rows and moves the channel's checkpoint in the
+    same transaction, so an interrupted backfill resumes without skipping
+    messages. Products already recorded from the same message (live, or by
+    an earlier backfill of any scope) are skipped. Returns the number of
+    rows inserted.
+    """
+    with _lock:
+        conn = get_connection()
+        try:
+            with conn:
+                message_ids = _source_message_ids(conn, [record[3] for record in records if record[3]])
+                rows = [
+                    (product_id, price, currency, message_ids.get(source_msg), _channel_key(conn, int(channel)), message_id, created_at)
+                    for product_id, price, currency, source_msg, channel, message_id, created_at in records
+                ]
+                cursor = conn.executemany("""
+                    INSERT OR IGNORE INTO price_history (product_id, price, currency, source_msg_id, channel_id, message_id, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                conn.execute("""
+                    INSERT INTO backfill_checkpoints (peer_id, scope, since, last_message_id) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (peer_id, scope) DO UPDATE SET
+                        since = excluded.since,
+                        last_message_id = excluded.last_message_id,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (peer_id, scope, since, last_message_id))
+        except Exception:
+            _channel_keys.clear()
+            raise
+    return cursor.rowcount
+
+def list_high_water_marks():
+    """Returns {peer_id: last_message_id} of every channel processed so far."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute("SELECT peer_id, last_message_id FROM high_water_marks").fetchall()
+    return dict(rows)
+
+def save_high_water_marks(rows):
+    """Raises the (peer_id, last_message_id) marks in a single transaction; marks never move back."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.executemany(_RAISE_HIGH_WATER_MARK, rows)
+
+def list_product_tags():
+    """Returns (product_id, tag) for every tagged product."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute("SELECT product_id, tag FROM product_tags").fetchall()
+    return rows
+
+def add_product_tag(product_id: int, tag: str):
+    """Tags a product. Returns False if the product doesn't exist."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            if conn.execute("SELECT 1 FROM watched_products WHERE id = ?", (product_id,)).fetchone() is None:
+                return False
+            conn.execute("INSERT OR IGNORE INTO product_tags (product_id, tag) VALUES (?, ?)", (product_id, tag))
+    return True
+
+def delete_product_tag(product_id: int, tag: str):
+    """Removes a tag from a product. Returns False if the product didn't have it."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM product_tags WHERE product_id = ? AND tag = ?", (product_id, tag))
+    return cursor.rowcount > 0
+
+def list_forward_routes():
+    """Returns (id, product_id, tag, target_id) for every route; one of product_id and tag is None."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute("SELECT id, product_id, tag, target_id FROM forward_routes ORDER BY id").fetchall()
+    return rows
+
+def add_forward_route(product_id, tag, target_id: int):
+    """Routes a product (or every product with `tag`) to a target channel. Returns the route ID."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO forward_routes (product_id, tag, target_id) VALUES (?, ?, ?)", (product_id, tag, target_id)
+            )
+    return cursor.lastrowid
+
+def delete_forward_route(route_id: int):
+    """Deletes a route. Returns False if it doesn't exist."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM forward_routes WHERE id = ?", (route_id,))
+    return cursor.rowcount > 0
+
+def get_data_version() -> int:
+    """Returns the counter bumped by every wishlist or whitelist change."""
+    with _lock:
+        conn = get_connection()
+        return conn.execute("SELECT counter FROM data_version WHERE id = 1").fetchone()[0]
+
 def add_whitelisted_channel(channel_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO whitelisted_channels (channel_id) VALUES (?)", (channel_id,))
-    conn.commit()
-    conn.close()
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute("INSERT INTO whitelisted_channels (channel_id) VALUES (?)", (channel_id,))
     print(f"Channel (ID: {channel_id}) added to whitelist.")
 
 def delete_whitelisted_channel(channel_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM whitelisted_channels WHERE channel_id = ?", (channel_id,))
-    conn.commit()
-    conn.close()
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute("DELETE FROM whitelisted_channels WHERE channel_id = ?", (channel_id,))
     print(f"Channel ID {channel_id} removed from whitelist.")
 
 def list_whitelisted_channels():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT channel_id FROM whitelisted_channels")
-    channels = cursor.fetchall()
-    conn.close()
+    with _lock:
+        conn = get_connection()
+        channels = conn.execute("SELECT channel_id FROM whitelisted_channels").fetchall()
 
     output = [row[0] for row in channels]
     return output
+
+def get_daily_prices(product_id: int, days: int):
+    """Returns (day, min, avg, max, count) rows for a product over the last `days` days, newest first."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute("""
+            SELECT day, min_price, sum_price / count, max_price, count
+            FROM price_daily_product
+            WHERE product_id = ? AND day >= date('now', ?)
+            ORDER BY day DESC
+        """, (product_id, f"-{days - 1} days")).fetchall()
+    return rows
+
+def get_recent_daily_mins(days: int):
+    """Returns (product_id, day, min_price) rows for the last `days` days."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute(
+            "SELECT product_id, day, min_price FROM price_daily_product WHERE day >= date('now', ?)",
+            (f"-{days - 1} days",),
+        ).fetchall()
+    return rows
+
+def get_lowest_price(product_id: int):
+    """Returns (day, price) of the lowest recorded price for a product, or None."""
+    with _lock:
+        conn = get_connection()
+        row = conn.execute("""
+            SELECT day, min_price FROM price_daily_product
+            WHERE product_id = ?
+            ORDER BY min_price, day LIMIT 1
+        """, (product_id,)).fetchone()
+    return row
+
+def get_price_stats(days: int):
+    """Returns record totals and the busiest channels (peer_id, count) over the last `days` days."""
+    with _lock:
+        conn = get_connection()
+        total, products = conn.execute(
+            "SELECT COALESCE(SUM(count), 0), COUNT(DISTINCT product_id) FROM price_daily_product"
+        ).fetchone()
+        recent = conn.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM price_daily_product WHERE day >= date('now', ?)",
+            (f"-{days - 1} days",),
+        ).fetchone()[0]
+        top_channels = conn.execute("""
+            SELECT c.peer_id, SUM(r.count) AS records
+            FROM price_daily_channel r JOIN channels c ON c.id = r.channel_id
+            WHERE r.day >= date('now', ?)
+            GROUP BY r.channel_id
+            ORDER BY records DESC LIMIT 10
+        """, (f"-{days - 1} days",)).fetchall()
+    return {
+        "total_records": total,
+        "priced_products": products,
+        "recent_records": recent,
+        "top_channels": top_channels,
+    }
+
+def list_cached_entities():
+    """Returns (peer_id, title, access_hash, updated_at) for every cached entity."""
+    with _lock:
+        conn = get_connection()
+        rows = conn.execute("SELECT peer_id, title, access_hash, updated_at FROM entity_cache").fetchall()
+    return rows
+
+def upsert_cached_entities(rows):
+    """Inserts or refreshes (peer_id, title, access_hash, updated_at) rows in a single transaction."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.executemany("""
+                INSERT INTO entity_cache (peer_id, title, access_hash, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (peer_id) DO UPDATE SET
+                    title = excluded.title,
+                    access_hash = COALESCE(excluded.access_hash, access_hash),
+                    updated_at = excluded.updated_at
+            """, rows)
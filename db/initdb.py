@@ -1,36 +1,24 @@
 # init_db.py
-import sqlite3
+import argparse
+import logging
+import os
+import sys
 
-conn = sqlite3.connect("products.db")
-cursor = conn.cursor()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS watched_products (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-)
-''')
+from db.db import enable_incremental_vacuum  # noqa: E402
+from db.migrations import run_migrations  # noqa: E402
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS price_history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    product_id INTEGER,
-    price REAL,
-    currency TEXT,
-    source_msg TEXT,
-    channel TEXT,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(product_id) REFERENCES watched_products(id)
-)
-''')
+parser = argparse.ArgumentParser(description="Creates the database or migrates it to the latest schema.")
+parser.add_argument("--incremental-vacuum", action="store_true",
+                    help="switch an older database to incremental auto-vacuum (one full VACUUM, stop the bot first)")
+args = parser.parse_args()
+logging.basicConfig(level=logging.INFO, format="%(message)s") # Migration progress
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS whitelisted_channels (
-    channel_id INTEGER PRIMARY KEY
-)
-''')
-
-conn.commit()
-conn.close()
-print("Database initialized!")
+version = run_migrations()
+print(f"Database initialized! (schema version {version})")
+if args.incremental_vacuum:
+    if enable_incremental_vacuum():
+        print("Database switched to incremental vacuum.")
+    else:
+        print("Database already uses incremental vacuum.")
@@ -0,0 +1,317 @@
+import logging
+import sqlite3
+
+from db.db import _lock, _source_message_ids, get_connection
+
+# The bot's logger, looked up by name: importing config would make
+# db/initdb.py require Telegram credentials
+logger = logging.getLogger("config")
+
+MIGRATION_CHUNK_SIZE = 10000 # Rows read at a time by migrations that rewrite price_history
+
+
+def _initial_schema(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS watched_products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS price_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        price REAL,
+        currency TEXT,
+        source_msg TEXT,
+        channel TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(product_id) REFERENCES watched_products(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS whitelisted_channels (
+        channel_id INTEGER PRIMARY KEY
+    )
+    ''')
+
+def _unique_product_names(conn: sqlite3.Connection):
+    # Merge products whose names only differ by case into the oldest one
+    duplicates = conn.execute('''
+        SELECT p.id, (SELECT MIN(k.id) FROM watched_products k WHERE k.name = p.name COLLATE NOCASE)
+        FROM watched_products p
+    ''').fetchall()
+    for product_id, keep_id in duplicates:
+        if product_id != keep_id:
+            conn.execute("UPDATE price_history SET product_id = ? WHERE product_id = ?", (keep_id, product_id))
+            conn.execute("DELETE FROM watched_products WHERE id = ?", (product_id,))
+    conn.execute("CREATE UNIQUE INDEX idx_watched_products_name ON watched_products (name COLLATE NOCASE)")
+
+def _normalized_channels(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE channels (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        peer_id INTEGER NOT NULL UNIQUE
+    )
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO channels (peer_id)
+    SELECT DISTINCT CAST(channel AS INTEGER) FROM price_history WHERE channel IS NOT NULL
+    ''')
+    conn.execute('''
+    CREATE TABLE price_history_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        price REAL,
+        currency TEXT,
+        source_msg TEXT,
+        channel_id INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(product_id) REFERENCES watched_products(id),
+        FOREIGN KEY(channel_id) REFERENCES channels(id)
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO price_history_new (id, product_id, price, currency, source_msg, channel_id, created_at)
+    SELECT h.id, h.product_id, h.price, h.currency, h.source_msg, c.id, h.created_at
+    FROM price_history h LEFT JOIN channels c ON c.peer_id = CAST(h.channel AS INTEGER)
+    ''')
+    conn.execute("DROP TABLE price_history")
+    conn.execute("ALTER TABLE price_history_new RENAME TO price_history")
+    conn.execute("CREATE INDEX idx_price_history_product_created ON price_history (product_id, created_at)")
+    conn.execute("CREATE INDEX idx_price_history_channel_created ON price_history (channel_id, created_at)")
+
+def _daily_rollups(conn: sqlite3.Connection):
+    for table, key in (("price_daily_product", "product_id"), ("price_daily_channel", "channel_id")):
+        conn.execute(f'''
+        CREATE TABLE {table} (
+            {key} INTEGER NOT NULL,
+            day DATE NOT NULL,
+            min_price REAL NOT NULL,
+            max_price REAL NOT NULL,
+            sum_price REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY ({key}, day)
+        ) WITHOUT ROWID
+        ''')
+        conn.execute(f'''
+        INSERT INTO {table} ({key}, day, min_price, max_price, sum_price, count)
+        SELECT {key}, date(created_at), MIN(price), MAX(price), SUM(price), COUNT(*)
+        FROM price_history WHERE {key} IS NOT NULL AND price IS NOT NULL
+        GROUP BY {key}, date(created_at)
+        ''')
+        conn.execute(f"CREATE INDEX idx_{table}_day ON {table} (day)")
+    # Keep the rollups current on every insert, whoever writes the row
+    conn.execute('''
+    CREATE TRIGGER price_history_rollup AFTER INSERT ON price_history
+    WHEN NEW.price IS NOT NULL
+    BEGIN
+        INSERT INTO price_daily_product (product_id, day, min_price, max_price, sum_price, count)
+        SELECT NEW.product_id, date(NEW.created_at), NEW.price, NEW.price, NEW.price, 1
+        WHERE NEW.product_id IS NOT NULL
+        ON CONFLICT (product_id, day) DO UPDATE SET
+            min_price = MIN(min_price, excluded.min_price),
+            max_price = MAX(max_price, excluded.max_price),
+            sum_price = sum_price + excluded.sum_price,
+            count = count + 1;
+        INSERT INTO price_daily_channel (channel_id, day, min_price, max_price, sum_price, count)
+        SELECT NEW.channel_id, date(NEW.created_at), NEW.price, NEW.price, NEW.price, 1
+        WHERE NEW.channel_id IS NOT NULL
+        ON CONFLICT (channel_id, day) DO UPDATE SET
+            min_price = MIN(min_price, excluded.min_price),
+            max_price = MAX(max_price, excluded.max_price),
+            sum_price = sum_price + excluded.sum_price,
+            count = count + 1;
+    END
+    ''')
+
+def _price_thresholds(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE watched_products ADD COLUMN target_price REAL")
+    conn.execute("ALTER TABLE watched_products ADD COLUMN drop_percent REAL")
+
+def _entity_cache(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE entity_cache (
+        peer_id INTEGER PRIMARY KEY,
+        title TEXT,
+        access_hash INTEGER,
+        updated_at REAL NOT NULL
+    )
+    ''')
+
+def _backfill_checkpoints(conn: sqlite3.Connection):
+    # Last message processed per channel and backfill scope ('all' or 'product:<id>')
+    conn.execute('''
+    CREATE TABLE backfill_checkpoints (
+        peer_id INTEGER NOT NULL,
+        scope TEXT NOT NULL,
+        since DATETIME NOT NULL,
+        last_message_id INTEGER NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (peer_id, scope)
+    ) WITHOUT ROWID
+    ''')
+
+def _high_water_marks(conn: sqlite3.Connection):
+    # Last live message processed per channel, for catching up after a restart
+    conn.execute('''
+    CREATE TABLE high_water_marks (
+        peer_id INTEGER PRIMARY KEY,
+        last_message_id INTEGER NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _forward_routes(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE product_tags (
+        product_id INTEGER NOT NULL,
+        tag TEXT NOT NULL,
+        PRIMARY KEY (product_id, tag),
+        FOREIGN KEY(product_id) REFERENCES watched_products(id)
+    ) WITHOUT ROWID
+    ''')
+    # Each route sends one product, or every product with a tag, to a target channel
+    conn.execute('''
+    CREATE TABLE forward_routes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        tag TEXT,
+        target_id INTEGER NOT NULL,
+        CHECK ((product_id IS NULL) <> (tag IS NULL)),
+        FOREIGN KEY(product_id) REFERENCES watched_products(id)
+    )
+    ''')
+    conn.execute("CREATE UNIQUE INDEX idx_forward_routes_product ON forward_routes (product_id, target_id) WHERE product_id IS NOT NULL")
+    conn.execute("CREATE UNIQUE INDEX idx_forward_routes_tag ON forward_routes (tag, target_id) WHERE tag IS NOT NULL")
+
+def _source_messages(conn: sqlite3.Connection):
+    # Promo texts stored once, zlib-compressed, under the hash of their content
+    conn.execute('''
+    CREATE TABLE source_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hash BLOB NOT NULL UNIQUE,
+        body BLOB NOT NULL
+    )
+    ''')
+    conn.execute("ALTER TABLE price_history ADD COLUMN source_msg_id INTEGER REFERENCES source_messages(id)")
+    # In chunks by id, so only one chunk of texts is ever in memory
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, source_msg FROM price_history WHERE id > ? AND source_msg IS NOT NULL AND source_msg != '' ORDER BY id LIMIT ?",
+            (last_id, MIGRATION_CHUNK_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+        message_ids = _source_message_ids(conn, [text for _, text in rows])
+        conn.executemany(
+            "UPDATE price_history SET source_msg_id = ? WHERE id = ?", [(message_ids[text], row_id) for row_id, text in rows]
+        )
+        last_id = rows[-1][0]
+    conn.execute("ALTER TABLE price_history DROP COLUMN source_msg")
+    conn.execute("CREATE INDEX idx_price_history_source_msg ON price_history (source_msg_id, created_at)")
+
+def _data_version(conn: sqlite3.Connection):
+    # Bumped on every wishlist or whitelist change, whoever writes it, so the
+    # on-disk matcher snapshot can tell whether it is still current
+    conn.execute('''
+    CREATE TABLE data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        counter INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("INSERT INTO data_version (id, counter) VALUES (1, 0)")
+    for table, event in (
+        ("watched_products", "INSERT"), ("watched_products", "UPDATE OF name"), ("watched_products", "DELETE"),
+        ("whitelisted_channels", "INSERT"), ("whitelisted_channels", "DELETE"),
+    ):
+        conn.execute(f'''
+        CREATE TRIGGER {table}_{event.split()[0].lower()}_version AFTER {event} ON {table}
+        BEGIN
+            UPDATE data_version SET counter = counter + 1 WHERE id = 1;
+        END
+        ''')
+
+def _price_message_ids(conn: sqlite3.Connection):
+    # Telegram message a price was read from. Live processing, catch-up and
+    # backfill can all reach the same post; the unique index makes the later
+    # writes no-ops (rows recorded before this step have no message ID)
+    conn.execute("ALTER TABLE price_history ADD COLUMN message_id INTEGER")
+    conn.execute('''
+    CREATE UNIQUE INDEX idx_price_history_message ON price_history (channel_id, message_id, product_id)
+    WHERE message_id IS NOT NULL
+    ''')
+
+def _marked_basic_groups(conn: sqlite3.Connection):
+    # Basic groups used to be recorded under their positive chat ID, and are
+    # recorded under the marked (negative) ID since then; channels always had
+    # the -100 prefix, so every positive peer ID is an old basic group row
+    for old_id, peer_id in conn.execute("SELECT id, peer_id FROM channels WHERE peer_id > 0").fetchall():
+        row = conn.execute("SELECT id FROM channels WHERE peer_id = ?", (-peer_id,)).fetchone()
+        if row is None:
+            conn.execute("UPDATE channels SET peer_id = ? WHERE id = ?", (-peer_id, old_id))
+            continue
+        new_id = row[0]
+        conn.execute("UPDATE OR IGNORE price_history SET channel_id = ? WHERE channel_id = ?", (new_id, old_id))
+        conn.execute("DELETE FROM price_history WHERE channel_id = ?", (old_id,)) # The same post recorded under both IDs
+        conn.execute('''
+        INSERT INTO price_daily_channel (channel_id, day, min_price, max_price, sum_price, count)
+        SELECT ?, day, min_price, max_price, sum_price, count FROM price_daily_channel WHERE channel_id = ?
+        ON CONFLICT (channel_id, day) DO UPDATE SET
+            min_price = MIN(min_price, excluded.min_price),
+            max_price = MAX(max_price, excluded.max_price),
+            sum_price = sum_price + excluded.sum_price,
+            count = count + excluded.count
+        ''', (new_id, old_id))
+        conn.execute("DELETE FROM price_daily_channel WHERE channel_id = ?", (old_id,))
+        conn.execute("DELETE FROM channels WHERE id = ?", (old_id,))
+    conn.execute('''
+    INSERT INTO high_water_marks (peer_id, last_message_id, updated_at)
+    SELECT -peer_id, last_message_id, updated_at FROM high_water_marks WHERE peer_id > 0
+    ON CONFLICT (peer_id) DO UPDATE SET last_message_id = MAX(last_message_id, excluded.last_message_id)
+    ''')
+    conn.execute("DELETE FROM high_water_marks WHERE peer_id > 0")
+
+# (version, description, step). Steps run in order inside one transaction
+# each; PRAGMA user_version records the last one applied. Never edit a
+# released step, append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "unique product names", _unique_product_names),
+    (3, "normalized channels and price_history indexes", _normalized_channels),
+    (4, "daily price rollups", _daily_rollups),
+    (5, "per-product price thresholds", _price_thresholds),
+    (6, "entity cache", _entity_cache),
+    (7, "backfill checkpoints", _backfill_checkpoints),
+    (8, "per-channel high-water marks", _high_water_marks),
+    (9, "product tags and forward routes", _forward_routes),
+    (10, "content-addressed source messages", _source_messages),
+    (11, "wishlist and whitelist change counter", _data_version),
+    (12, "source message IDs on price records", _price_message_ids),
+    (13, "marked peer IDs for basic groups", _marked_basic_groups),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations() -> int:
+    """Applies every pending migration and returns the resulting schema version."""
+    with _lock:
+        conn = get_connection()
+        current = get_schema_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                conn.execute("BEGIN")
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            current = version
+            logger.info(f"🗄️ Database migrated to version {version} ({description}).")
+        return current
@@ -0,0 +1,91 @@
+import asyncio
+
+from config import (
+    RETENTION_BATCH_SIZE,
+    RETENTION_INTERVAL_HOURS,
+    SOURCE_RETENTION_DAYS,
+    VACUUM_PAGES_PER_STEP,
+    logger,
+)
+from db import async_db
+from metrics import counter
+
+messages_pruned = counter("db_source_messages_pruned_total", "Stored promo texts deleted by the retention job")
+
+
+class SourceMessageRetention:
+    """
+    Periodically deletes the stored promo texts no price record from the
+    last `retention_days` days refers to, then gives the freed pages back to
+    the file system with incremental vacuum. Both run in small steps on the
+    DB thread, so price writes are never held up for long. A database created
+    before incremental vacuum is left as it is (its freed pages are reused,
+    not released) until it is converted offline with
+    `python db/initdb.py --incremental-vacuum`.
+    """
+
+    def __init__(self, retention_days: int, interval_hours: float, batch_size: int, vacuum_pages: int):
+        self._retention_days = retention_days
+        self._interval = interval_hours * 3600
+        self._batch_size = batch_size
+        self._vacuum_pages = vacuum_pages
+        self._incremental = True
+        self._task = None
+
+    def start(self):
+        """Starts the background retention loop (unless retention is disabled)."""
+        if self._task is None and self._retention_days > 0:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🧹 Source message retention started: texts kept {self._retention_days} days.")
+
+    async def _run(self):
+        try:
+            self._incremental = await async_db.uses_incremental_vacuum()
+        except Exception as e:
+            logger.error(f"⚠️ Could not read the auto-vacuum mode: {e}")
+        if not self._incremental:
+            logger.warning("⚠️ Database not in incremental vacuum mode: pruned space is reused but never released. "
+                           "Stop the bot and run `python db/initdb.py --incremental-vacuum` to convert it.")
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"⚠️ Source message retention failed: {e}")
+            await asyncio.sleep(self._interval)
+
+    async def run_once(self):
+        """Prunes expired promo texts and reclaims the space they used."""
+        deleted = 0
+        after_id = 0
+        while after_id is not None:
+            after_id, count = await async_db.prune_source_messages(self._retention_days, after_id, self._batch_size)
+            deleted += count
+        messages_pruned.inc(deleted)
+
+        free_pages = await async_db.incremental_vacuum(self._vacuum_pages) if self._incremental else 0
+        while free_pages > 0:
+            await asyncio.sleep(0) # Let queued writes in between steps
+            left = await async_db.incremental_vacuum(self._vacuum_pages)
+            if left >= free_pages: # Not in incremental mode, nothing is released
+                break
+            free_pages = left
+        if deleted:
+            logger.info(f"🧹 Pruned {deleted} promo texts older than {self._retention_days} days.")
+
+    async def stop(self):
+        """Stops the retention loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+source_retention = SourceMessageRetention(
+    SOURCE_RETENTION_DAYS,
+    interval_hours=RETENTION_INTERVAL_HOURS,
+    batch_size=RETENTION_BATCH_SIZE,
+    vacuum_pages=VACUUM_PAGES_PER_STEP,
+)
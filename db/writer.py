@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from config import PRICE_WRITE_BATCH_SIZE, PRICE_WRITE_FLUSH_MS, logger
+from db.async_db import add_price_records
+from metrics import counter, histogram
+
+records_written = counter("db_price_records_written_total", "Price records written to the database")
+write_failures = counter("db_write_failures_total", "Failed price record batch writes (retried)")
+records_dropped = counter("db_price_records_dropped_total", "Price records dropped after MAX_WRITE_ATTEMPTS failed writes")
+write_seconds = histogram("db_write_seconds", "Time to write one batch of price records")
+
+MAX_WRITE_ATTEMPTS = 3 # Flushes a failing batch is tried in before its records are written one by one
+
+
+class PriceRecordWriter:
+    """
+    Buffers price records and writes them in one transaction, either every
+    `flush_interval_ms` or as soon as `max_batch_size` records are pending.
+    A batch that fails is retried on the next flushes, next to the new
+    records; after MAX_WRITE_ATTEMPTS its records are written one by one and
+    those that still fail are dropped, so a bad record never holds up the
+    rest.
+    """
+
+    def __init__(self, flush_interval_ms: int, max_batch_size: int):
+        self._flush_interval = flush_interval_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._pending = []
+        self._retries = [] # (batch, failed attempts) of batches that failed
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """Starts the background flush loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"💾 Price writer started (every {int(self._flush_interval * 1000)}ms or {self._max_batch_size} records).")
+
+    def add(self, product_id: int, price: float, currency: str, source_msg: str, channel: str, message_id=None):
+        """Queues a price record for the next batch."""
+        self._pending.append((product_id, price, currency, source_msg, channel, message_id))
+        if len(self._pending) >= self._max_batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Writes all pending records and retries the batches that failed before."""
+        batches, self._retries = self._retries, []
+        if self._pending:
+            batches.append((self._pending, 0))
+            self._pending = []
+        for batch, attempts in batches:
+            await self._write(batch, attempts)
+
+    async def _write(self, batch, attempts: int):
+        start = time.perf_counter()
+        try:
+            written = await add_price_records(batch) # Less than the batch when a message was already recorded
+            write_seconds.observe(time.perf_counter() - start)
+            records_written.inc(written)
+            return
+        except Exception as e:
+            error = e
+        write_failures.inc()
+        attempts += 1
+        if attempts < MAX_WRITE_ATTEMPTS:
+            logger.error(f"⚠️ Failed to write {len(batch)} price records (attempt {attempts}), will retry: {error}")
+            self._retries.append((batch, attempts))
+        elif len(batch) > 1:
+            logger.error(f"⚠️ Failed to write {len(batch)} price records {attempts} times, writing them one by one: {error}")
+            for record in batch:
+                await self._write([record], MAX_WRITE_ATTEMPTS - 1) # One last try each
+        else:
+            records_dropped.inc()
+            product_id, price, _, _, channel, message_id = batch[0]
+            logger.error(f"🗑️ Dropping price record of product {product_id} (R${price}, message {message_id} from {channel}): {error}")
+
+    async def stop(self):
+        """Stops the flush loop and writes whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        unwritten = sum(len(batch) for batch, _ in self._retries)
+        if unwritten:
+            logger.error(f"🛑 {unwritten} price records could not be written on shutdown.")
+
+
+price_writer = PriceRecordWriter(PRICE_WRITE_FLUSH_MS, PRICE_WRITE_BATCH_SIZE)
@@ -0,0 +1,160 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+from config import (
+    DEDUP_CACHE_SIZE,
+    DEDUP_ENABLED,
+    DEDUP_LOG_EVERY,
+    DEDUP_SIMHASH_DISTANCE,
+    DEDUP_WINDOW_SECONDS,
+    logger,
+)
+
+_URL_RE = re.compile(r"(?:https?://|www\.|t\.me/)\S+|#\w+", re.IGNORECASE)
+_PRICE_RE = re.compile(r"r\$\s*(\d[\d.,]*)")
+_WORD_RE = re.compile(r"\w+")
+
+SIMHASH_BITS = 64
+
+
+def normalize_promo_text(text: str):
+    """
+    Reduces a promo to what identifies the deal: lowercase words without
+    links, hashtags, emoji or punctuation, plus the set of prices it mentions.
+    Returns (normalized_text, prices).
+    """
+    text = _URL_RE.sub(" ", text.casefold())
+    prices = tuple(sorted({re.sub(r"\D", "", price) for price in _PRICE_RE.findall(text)}))
+    return " ".join(_WORD_RE.findall(text)), prices
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(normalized_text: str) -> int:
+    """64-bit SimHash over the words and word pairs of a normalized text."""
+    words = normalized_text.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        h = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+class DuplicateCache:
+    """
+    Remembers recently seen promos for `window_seconds` (at most `max_size`
+    of them, least recently seen evicted first).
+
+    A promo is a duplicate when its normalized text is identical to a cached
+    one, or when it mentions the same prices and its SimHash is within
+    `max_distance` bits of a cached one. Fingerprints are split into
+    max_distance + 1 bands, and two fingerprints that close always agree on
+    at least one band, so near-duplicate candidates come from band buckets
+    instead of a scan of the whole cache.
+    """
+
+    def __init__(self, max_size: int, window_seconds: int, max_distance: int):
+        self._max_size = max_size
+        self._window = window_seconds
+        self._max_distance = max_distance
+        self._band_count = max_distance + 1
+        self._band_bits = SIMHASH_BITS // self._band_count
+        self._band_mask = (1 << self._band_bits) - 1
+        self._entries = OrderedDict() # exact hash -> (seen_at, fingerprint, prices)
+        self._bands = {}              # (prices, band, value) -> set of exact hashes
+        self.checks = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+
+    def _band_keys(self, fingerprint, prices):
+        return [
+            (prices, band, fingerprint >> (band * self._band_bits) & self._band_mask)
+            for band in range(self._band_count)
+        ]
+
+    def _remove(self, key):
+        _, fingerprint, prices = self._entries.pop(key)
+        for band_key in self._band_keys(fingerprint, prices):
+            bucket = self._bands.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._bands[band_key]
+
+    def _expire(self, now):
+        while self._entries:
+            key, (seen_at, _, _) = next(iter(self._entries.items()))
+            if now - seen_at < self._window:
+                break
+            self._remove(key)
+
+    def _is_fresh(self, key, now):
+        entry = self._entries.get(key)
+        return entry is not None and now - entry[0] < self._window
+
+    def check(self, text: str) -> bool:
+        """Returns True if the text duplicates a recent promo; otherwise remembers it."""
+        now = time.monotonic()
+        self._expire(now)
+        self.checks += 1
+
+        normalized, prices = normalize_promo_text(text)
+        key = hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+        duplicate = False
+
+        if self._is_fresh(key, now):
+            self.exact_hits += 1
+            self._entries.move_to_end(key)
+            duplicate = True
+        else:
+            fingerprint = simhash(normalized)
+            band_keys = self._band_keys(fingerprint, prices)
+            for band_key in band_keys:
+                for other in self._bands.get(band_key, ()):
+                    if self._is_fresh(other, now) and (self._entries[other][1] ^ fingerprint).bit_count() <= self._max_distance:
+                        self.near_hits += 1
+                        self._entries.move_to_end(other)
+                        duplicate = True
+                        break
+                if duplicate:
+                    break
+
+            if not duplicate:
+                self._entries[key] = (now, fingerprint, prices)
+                for band_key in band_keys:
+                    self._bands.setdefault(band_key, set()).add(key)
+                if len(self._entries) > self._max_size:
+                    self._remove(next(iter(self._entries)))
+
+        if DEDUP_LOG_EVERY > 0 and self.checks % DEDUP_LOG_EVERY == 0:
+            logger.info(f"♻️ Dedup cache: {self.format_stats()}")
+        return duplicate
+
+    def stats(self) -> dict:
+        """Returns the cache counters."""
+        hits = self.exact_hits + self.near_hits
+        return {
+            "size": len(self._entries),
+            "checks": self.checks,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "hit_rate": f"{hits / self.checks:.1%}" if self.checks else "n/a",
+        }
+
+    def format_stats(self) -> str:
+        """Returns the counters as a single log/reply line."""
+        return ", ".join(f"{key}={value}" for key, value in self.stats().items())
+
+
+duplicate_cache = DuplicateCache(DEDUP_CACHE_SIZE, DEDUP_WINDOW_SECONDS, DEDUP_SIMHASH_DISTANCE)
+
+
+def is_duplicate_promo(text: str) -> bool:
+    """Returns True if the promo was already seen recently (always False when dedup is disabled)."""
+    return DEDUP_ENABLED and duplicate_cache.check(text)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from typing import NamedTuple, Optional
+
+from telethon import utils
+from telethon.errors import FloodWaitError
+from telethon.tl.types import InputPeerChannel, PeerChannel
+
+from config import ENTITY_CACHE_TTL, ENTITY_RESOLVE_CONCURRENCY, logger
+from db import async_db
+from peer_ids import channel_peer_id
+
+
+class CachedEntity(NamedTuple):
+    title: Optional[str]
+    access_hash: Optional[int]
+    updated_at: float
+
+
+class EntityCache:
+    """
+    Channel titles and access hashes, kept in memory and persisted to the
+    entity_cache table. Entries older than `ttl` seconds are refreshed on
+    use. A get_dialogs sweep fills the cache in one request; the remaining
+    misses are resolved with at most `concurrency` get_entity calls at a time.
+    """
+
+    def __init__(self, ttl: int, concurrency: int):
+        self._ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._entries = {} # marked peer ID -> CachedEntity
+        self._dirty = {}
+        self._warmed_at = 0.0
+        self._warm_lock = asyncio.Lock()
+
+    async def load(self):
+        """Loads the persisted entries."""
+        try:
+            rows = await async_db.list_cached_entities()
+        except Exception as e:
+            logger.error(f"⚠️ Error loading entity cache from DB: {e}")
+            return
+        self._entries = {peer_id: CachedEntity(title, access_hash, updated_at) for peer_id, title, access_hash, updated_at in rows}
+        logger.info(f"🗂️ Entity cache loaded: {len(self._entries)} entries.")
+
+    async def flush(self):
+        """Persists entries added or refreshed since the last flush."""
+        if not self._dirty:
+            return
+        rows = [(peer_id, e.title, e.access_hash, e.updated_at) for peer_id, e in self._dirty.items()]
+        self._dirty = {}
+        try:
+            await async_db.upsert_cached_entities(rows)
+        except Exception as e:
+            logger.error(f"⚠️ Failed to persist {len(rows)} entity cache entries: {e}")
+
+    def _is_fresh(self, entry: Optional[CachedEntity]) -> bool:
+        return entry is not None and time.time() - entry.updated_at < self._ttl
+
+    def put(self, entity):
+        """Stores a Telethon entity (channel, chat or user) seen anywhere."""
+        peer_id = utils.get_peer_id(entity)
+        title = getattr(entity, "title", None) or getattr(entity, "first_name", None)
+        entry = CachedEntity(title, getattr(entity, "access_hash", None), time.time())
+        self._entries[peer_id] = entry
+        self._dirty[peer_id] = entry
+
+    def get(self, channel_id: int) -> Optional[CachedEntity]:
+        """Returns the cached entry for a channel, fresh or not."""
+        return self._entries.get(channel_peer_id(channel_id))
+
+    def get_title(self, channel_id: int) -> Optional[str]:
+        """Returns the cached title of a channel, if known."""
+        entry = self.get(channel_id)
+        return entry.title if entry else None
+
+    def get_input_peer(self, channel_id: int):
+        """Returns an InputPeerChannel built from the cached access hash, or None."""
+        key = channel_peer_id(channel_id)
+        entry = self._entries.get(key)
+        if entry is None or entry.access_hash is None:
+            return None
+        real_id, peer_type = utils.resolve_id(key)
+        return InputPeerChannel(real_id, entry.access_hash) if peer_type is PeerChannel else None
+
+    async def warm(self, client):
+        """Caches every channel and group of the account with a single dialogs sweep."""
+        async with self._warm_lock:
+            if time.time() - self._warmed_at < self._ttl:
+                return
+            try:
+                count = 0
+                async for dialog in client.iter_dialogs():
+                    if dialog.is_channel or dialog.is_group:
+                        self.put(dialog.entity)
+                        count += 1
+                self._warmed_at = time.time()
+                logger.info(f"🗂️ Entity cache warmed with {count} channels and groups.")
+            except FloodWaitError as e:
+                logger.warning(f"⏳ FloodWait while warming entity cache, retry in {e.seconds}s.")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not warm entity cache: {e}")
+            await self.flush()
+
+    async def _resolve(self, client, channel_id: int):
+        key = channel_peer_id(channel_id)
+        async with self._semaphore:
+            try:
+                entity = await client.get_entity(self.get_input_peer(channel_id) or key)
+            except FloodWaitError as e:
+                logger.warning(f"⏳ FloodWait resolving {channel_id} ({e.seconds}s), using cached title if any.")
+                return
+            except Exception as e:
+                logger.warning(f"Could not fetch title for channel {channel_id}: {e}")
+                return
+        self.put(entity)
+
+    async def resolve_titles(self, client, channel_ids) -> dict:
+        """
+        Returns {channel_id: title or None}. Fresh entries come from the cache;
+        with more than one miss the dialogs sweep runs first, then whatever is
+        still missing is fetched concurrently.
+        """
+        misses = [cid for cid in channel_ids if not self._is_fresh(self.get(cid))]
+        if len(misses) > 1:
+            await self.warm(client)
+            misses = [cid for cid in misses if not self._is_fresh(self.get(cid))]
+        if misses:
+            await asyncio.gather(*(self._resolve(client, cid) for cid in misses))
+            await self.flush()
+        return {cid: self.get_title(cid) for cid in channel_ids}
+
+    async def resolve_title(self, client, channel_id: int) -> Optional[str]:
+        """Returns the title of one channel, fetching it if not cached or stale."""
+        if not self._is_fresh(self.get(channel_id)):
+            await self._resolve(client, channel_id)
+            await self.flush()
+        entry = self.get(channel_id)
+        return entry.title if entry else None
+
+
+entity_cache = EntityCache(ENTITY_CACHE_TTL, ENTITY_RESOLVE_CONCURRENCY)
@@ -0,0 +1,144 @@
+import asyncio
+from collections import OrderedDict
+
+from config import CATCHUP_CONCURRENCY, CATCHUP_MAX_MESSAGES, HIGH_WATER_FLUSH_SECONDS, logger
+from data_manager import is_channel_whitelisted
+from db import async_db
+from entity_cache import entity_cache
+from handlers.ingest_queue import ChannelMessage, ingest_queue
+
+CLAIMED_MESSAGES_SIZE = 10000 # Recently queued (chat_id, message_id) pairs remembered
+
+
+class HighWaterMarks:
+    """
+    The newest processed message ID of every whitelisted source. Marks are
+    raised in memory as messages are processed and saved every
+    `flush_seconds`, so after a restart the gap of each channel starts right
+    after its mark. The price writer also raises the saved mark in the
+    transaction that records a message's prices, so a recorded message is
+    never fetched again; only a forward sent in the last PRICE_WRITE_FLUSH_MS
+    before a crash may be repeated. claim() lets a message that shows up both
+    live and in the catch-up fetch be queued only once.
+    """
+
+    def __init__(self, flush_seconds: int):
+        self._flush_seconds = flush_seconds
+        self._marks = {} # chat_id -> last processed message ID
+        self._saved = {}
+        self._claimed = OrderedDict()
+        self._task = None
+
+    async def load(self):
+        """Loads the saved marks from the database."""
+        try:
+            marks = await async_db.list_high_water_marks()
+        except Exception as e:
+            logger.error(f"⚠️ Error loading high-water marks from DB: {e}")
+            return
+        self._marks = marks
+        self._saved = dict(marks)
+        logger.info(f"🔖 High-water marks loaded for {len(marks)} sources.")
+
+    def items(self):
+        return list(self._marks.items())
+
+    def claim(self, chat_id: int, message_id: int) -> bool:
+        """Returns True the first time a message is seen, False for repeats."""
+        key = (chat_id, message_id)
+        if key in self._claimed:
+            return False
+        self._claimed[key] = None
+        if len(self._claimed) > CLAIMED_MESSAGES_SIZE:
+            self._claimed.popitem(last=False)
+        return True
+
+    def mark(self, chat_id: int, message_id: int):
+        """Records a processed message, raising the source's mark if it is newer."""
+        if message_id > self._marks.get(chat_id, 0):
+            self._marks[chat_id] = message_id
+
+    async def flush(self):
+        """Saves the marks that moved since the last flush."""
+        rows = [(chat_id, message_id) for chat_id, message_id in self._marks.items() if self._saved.get(chat_id) != message_id]
+        if not rows:
+            return
+        try:
+            await async_db.save_high_water_marks(rows)
+        except Exception as e:
+            logger.error(f"⚠️ Error saving high-water marks: {e}")
+            return
+        self._saved.update(rows)
+
+    def start(self):
+        """Starts the background flush loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._flush_seconds)
+            await self.flush()
+
+    async def stop(self):
+        """Stops the flush loop and saves the latest marks."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+high_water_marks = HighWaterMarks(HIGH_WATER_FLUSH_SECONDS)
+
+
+async def _catch_up_source(client, chat_id: int, last_message_id: int, semaphore) -> int:
+    peer = entity_cache.get_input_peer(chat_id) or chat_id
+    messages = []
+    async with semaphore:
+        try:
+            async for message in client.iter_messages(peer, min_id=last_message_id, limit=CATCHUP_MAX_MESSAGES):
+                messages.append(message)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not fetch missed messages of {chat_id}: {e}")
+
+    if len(messages) == CATCHUP_MAX_MESSAGES and messages[-1].id > last_message_id + 1:
+        logger.warning(f"⚠️ More than {CATCHUP_MAX_MESSAGES} messages missed in {chat_id}, only the newest are processed.")
+
+    queued = 0
+    for message in reversed(messages): # Oldest first, like they were posted
+        if not message.raw_text or not high_water_marks.claim(chat_id, message.id):
+            continue
+        await ingest_queue.put(ChannelMessage(
+            message_id=message.id,
+            chat_id=chat_id,
+            peer=message.peer_id,
+            text=message.raw_text,
+            date=message.date,
+        ), wait=True)
+        queued += 1
+    return queued
+
+async def catch_up(client, owns_peer=None):
+    """
+    Queues the messages every whitelisted source (for which `owns_peer`, if
+    given, is True) posted after its high-water mark, fetching
+    CATCHUP_CONCURRENCY sources at a time. They go through the normal
+    pipeline; messages whose prices were recorded before a crash are behind
+    the saved mark, so they are not fetched again.
+    """
+    sources = [
+        (chat_id, message_id) for chat_id, message_id in high_water_marks.items()
+        if is_channel_whitelisted(chat_id) and (owns_peer is None or owns_peer(chat_id))
+    ]
+    if not sources:
+        return
+    logger.info(f"⏪ Catching up on {len(sources)} sources...")
+    semaphore = asyncio.Semaphore(CATCHUP_CONCURRENCY)
+    counts = await asyncio.gather(*(
+        _catch_up_source(client, chat_id, message_id, semaphore) for chat_id, message_id in sources
+    ))
+    logger.info(f"⏪ Catch-up queued {sum(counts)} missed messages.")
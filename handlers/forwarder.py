@@ -0,0 +1,318 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+
+from telethon.errors import (
+    ChannelPrivateError,
+    ChatForwardsRestrictedError,
+    ChatWriteForbiddenError,
+    FloodWaitError,
+    UserNotParticipantError,
+)
+
+from client_setup import client
+from config import (
+    FORWARD_BATCH_SIZE,
+    FORWARD_BATCH_WINDOW_MS,
+    FORWARD_BURST,
+    FORWARD_MAX_ATTEMPTS,
+    FORWARD_QUEUE_SIZE,
+    FORWARD_RATE,
+    logger,
+)
+from metrics import counter, gauge, histogram
+
+TELEGRAM_MAX_FORWARD_IDS = 100 # Message IDs accepted by a single ForwardMessagesRequest
+
+
+send_seconds = histogram("forward_send_seconds", "Time of one successful forward or copy API call")
+flood_waits = counter("forward_flood_waits_total", "FloodWait errors received while forwarding")
+flood_wait_seconds = counter("forward_flood_wait_seconds_total", "Seconds spent sleeping through FloodWait")
+messages_sent = counter("forward_messages_total", "Messages forwarded or copied to a target channel")
+messages_dropped = counter("forward_dropped_total", "Messages that could not be delivered")
+
+
+@dataclass(slots=True)
+class ForwardJob:
+    """A message waiting to be sent to a target channel."""
+    message_id: int
+    chat_id: int
+    peer: object
+    text: str
+    copy: bool = False # Send the text instead of forwarding (source restricts forwards)
+    alone: bool = False # Forward in its own call (its batch failed, so one message may be bad)
+    attempts: int = 0
+
+
+class TokenBucket:
+    """
+    Allows `rate` operations per second on average, with bursts of up to
+    `capacity`. pause() holds every caller back, for a FloodWait.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def pause(self, seconds: float):
+        """Hands out no token for `seconds`, then starts refilling from empty."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._blocked_until
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class ForwardScheduler:
+    """
+    Owns every send to one target channel.
+
+    Jobs are submitted without waiting; a single task drains them, groups
+    messages from the same source into one forward_messages call, spaces API
+    calls with a token bucket and sleeps through FloodWait without holding up
+    message ingestion. Sources that restrict forwarding get their messages
+    re-queued as plain-text copies. When a batch fails otherwise (a deleted
+    message fails the whole call), its messages are retried one per call, so
+    only the bad one uses up its attempts.
+    """
+
+    def __init__(self, target_id: int, rate: float, burst: int, batch_size: int,
+                 batch_window_ms: int, max_attempts: int, queue_size: int, bucket: TokenBucket = None):
+        self._target_id = target_id
+        self._rate = rate
+        self._burst = burst
+        self._bucket = bucket or TokenBucket(rate, burst)
+        self._batch_size = max(1, min(batch_size, TELEGRAM_MAX_FORWARD_IDS))
+        self._batch_window = batch_window_ms / 1000
+        self._max_attempts = max_attempts
+        self._queue_size = queue_size
+        self._jobs = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.forwarded = 0
+        self.copied = 0
+        self.api_calls = 0
+        self.flood_waits = 0
+        self.dropped = 0
+
+    def start(self):
+        """Starts the sending task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📤 Forward scheduler for {self._target_id} started: {self._rate}/s (burst {self._burst}), up to {self._batch_size} messages per call.")
+
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def submit(self, job: ForwardJob):
+        """Queues a message for sending to the target channel."""
+        if len(self._jobs) >= self._queue_size:
+            self.dropped += 1
+            messages_dropped.inc()
+            logger.warning("🗑️ Forward queue full, dropped message %s from %s.", job.message_id, job.chat_id,
+                           extra={"message_id": job.message_id, "channel_id": job.chat_id})
+            return
+        self._jobs.append(job)
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._jobs:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                if self._batch_window > 0:
+                    await asyncio.sleep(self._batch_window) # Let messages from the same burst join the batch
+            await self._bucket.acquire() # Jobs stay queued (and counted as pending) while waiting
+            batch = self._next_batch()
+            await self._send(batch)
+
+    def _next_batch(self):
+        """Takes the oldest job plus every queued job it can share an API call with."""
+        first = self._jobs.popleft()
+        if first.copy or first.alone:
+            return [first]
+        batch = [first]
+        remaining = deque()
+        while self._jobs and len(batch) < self._batch_size:
+            job = self._jobs.popleft()
+            if not job.copy and not job.alone and job.chat_id == first.chat_id:
+                batch.append(job)
+            else:
+                remaining.append(job)
+        remaining.extend(self._jobs)
+        self._jobs = remaining
+        return batch
+
+    async def _send(self, batch):
+        first = batch[0]
+        if not client or not client.is_connected():
+            logger.error(f"🛑 Forwarding failed: Client is not connected. Dropping {len(batch)} messages.")
+            self.dropped += len(batch)
+            messages_dropped.inc(len(batch))
+            return
+
+        self.api_calls += 1
+        start = time.perf_counter()
+        try:
+            if first.copy:
+                await client.send_message(entity=self._target_id, message=first.text)
+                self.copied += 1
+                messages_sent.inc()
+                send_seconds.observe(time.perf_counter() - start)
+                logger.info(" relayed message %s successfully.", first.message_id,
+                            extra={"message_id": first.message_id, "channel_id": first.chat_id})
+            else:
+                message_ids = [job.message_id for job in batch]
+                logger.info("▶️ Forwarding %d messages %s from %s to %s...", len(message_ids), message_ids, first.chat_id, self._target_id,
+                            extra={"channel_id": first.chat_id})
+                await client.forward_messages(entity=self._target_id, messages=message_ids, from_peer=first.peer)
+                self.forwarded += len(batch)
+                messages_sent.inc(len(batch))
+                send_seconds.observe(time.perf_counter() - start)
+                logger.info(" relayed %d messages successfully.", len(message_ids), extra={"channel_id": first.chat_id})
+        except FloodWaitError as e:
+            self.flood_waits += 1
+            flood_waits.inc()
+            flood_wait_seconds.inc(e.seconds)
+            logger.warning(f"⏳ FloodWait: pausing every target for {e.seconds}s, {len(batch)} messages to {self._target_id} wait.")
+            self._jobs.extendleft(reversed(batch))
+            self._bucket.pause(e.seconds) # The limit is per account, so the other targets' tasks wait too
+        except (UserNotParticipantError, ChannelPrivateError):
+            logger.error(f"🛑 Forwarding failed: UserBot is not a participant in the target channel {self._target_id} or channel is private.")
+            self.dropped += len(batch)
+            messages_dropped.inc(len(batch))
+        except ChatWriteForbiddenError:
+            logger.error(f"🛑 Forwarding failed: UserBot does not have permission to send messages in {self._target_id}.")
+            self.dropped += len(batch)
+            messages_dropped.inc(len(batch))
+        except ChatForwardsRestrictedError:
+            logger.info(f"⚠️ Forwarding failed: UserBot cannot forward messages from {first.chat_id}. Copying {len(batch)} messages instead...")
+            for job in batch:
+                job.copy = True
+                self.submit(job)
+        except Exception as e:
+            logger.error(f"🛑 Sending {len(batch)} messages from {first.chat_id} failed with unexpected error: {e}")
+            logger.exception("Forwarding exception details:")
+            if len(batch) > 1:
+                logger.info(f"✂️ Retrying the {len(batch)} messages from {first.chat_id} one per call.")
+                for job in batch:
+                    job.alone = True
+                self._jobs.extendleft(reversed(batch))
+                return
+            for job in batch:
+                job.attempts += 1
+                if job.attempts < self._max_attempts:
+                    self.submit(job)
+                else:
+                    self.dropped += 1
+                    messages_dropped.inc()
+                    logger.error(f"🛑 Giving up on message {job.message_id} from {job.chat_id} after {job.attempts} attempts.")
+
+    def stats(self) -> dict:
+        """Returns the current scheduler counters."""
+        return {
+            "pending": len(self._jobs),
+            "forwarded": self.forwarded,
+            "copied": self.copied,
+            "api_calls": self.api_calls,
+            "flood_waits": self.flood_waits,
+            "dropped": self.dropped,
+        }
+
+    async def stop(self, timeout: float = 10):
+        """Gives pending jobs up to `timeout` seconds to be sent, then stops the task."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._jobs and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._jobs:
+            logger.warning(f"⚠️ Stopping forward scheduler with {len(self._jobs)} messages not sent.")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+class ForwardDispatcher:
+    """
+    One ForwardScheduler per target channel, created on the first message
+    for that target. Each runs its own task, so a slow or unreachable target
+    doesn't hold up the others. They share one token bucket because
+    Telegram's rate limits apply to the account: the rate is split between
+    targets, and a FloodWait on any of them pauses them all.
+    """
+
+    def __init__(self, rate: float, burst: int, **scheduler_options):
+        self._rate = rate
+        self._burst = burst
+        self._options = scheduler_options
+        self._bucket = TokenBucket(rate, burst)
+        self._schedulers = {} # target_id -> ForwardScheduler
+        self._started = False
+
+    def _scheduler(self, target_id: int) -> ForwardScheduler:
+        scheduler = self._schedulers.get(target_id)
+        if scheduler is None:
+            scheduler = ForwardScheduler(target_id, self._rate, self._burst, bucket=self._bucket, **self._options)
+            self._schedulers[target_id] = scheduler
+            if self._started:
+                scheduler.start()
+        return scheduler
+
+    def start(self):
+        """Starts the sending task of every target (and of targets added later)."""
+        self._started = True
+        for scheduler in self._schedulers.values():
+            scheduler.start()
+
+    def submit(self, job: ForwardJob, target_ids):
+        """Queues a message for sending to each of the target channels."""
+        for target_id in target_ids:
+            # Every target retries and falls back to copying on its own
+            self._scheduler(target_id).submit(replace(job))
+
+    def pending(self) -> int:
+        return sum(scheduler.pending() for scheduler in self._schedulers.values())
+
+    def stats(self) -> dict:
+        """Returns the scheduler counters summed over every target."""
+        totals = {"targets": len(self._schedulers)}
+        for scheduler in self._schedulers.values():
+            for key, value in scheduler.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    async def stop(self, timeout: float = 10):
+        """Gives pending jobs up to `timeout` seconds to be sent, then stops every target's task."""
+        self._started = False
+        await asyncio.gather(*(scheduler.stop(timeout) for scheduler in self._schedulers.values()))
+
+
+forwarder = ForwardDispatcher(
+    rate=FORWARD_RATE,
+    burst=FORWARD_BURST,
+    batch_size=FORWARD_BATCH_SIZE,
+    batch_window_ms=FORWARD_BATCH_WINDOW_MS,
+    max_attempts=FORWARD_MAX_ATTEMPTS,
+    queue_size=FORWARD_QUEUE_SIZE,
+)
+gauge("forward_queue_depth", "Messages waiting to be forwarded", forwarder.pending)
@@ -0,0 +1,142 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+
+from config import (
+    INGEST_OVERFLOW_POLICY,
+    INGEST_QUEUE_SIZE,
+    INGEST_STATS_INTERVAL,
+    INGEST_WORKERS,
+    logger,
+)
+from metrics import gauge
+
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+@dataclass(slots=True)
+class ChannelMessage:
+    """The parts of a channel update that promo processing needs."""
+    message_id: int
+    chat_id: int # Marked peer ID (event.chat_id) used for whitelist checks and records
+    peer: object # Telethon peer of the source, used as from_peer when forwarding
+    text: str
+    date: datetime | None = None
+
+
+class IngestQueue:
+    """
+    Bounded queue between the Telethon update handler and a pool of workers.
+
+    The event handler only calls put(), so a slow forward or DB write inside a
+    worker never delays the reception of other updates. When the queue is full
+    the overflow policy decides whether to wait for room ("block"), discard the
+    incoming message ("drop_newest") or discard the oldest queued one
+    ("drop_oldest").
+    """
+
+    def __init__(self, maxsize: int, workers: int, overflow_policy: str):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}', expected one of {OVERFLOW_POLICIES}")
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._worker_count = workers
+        self._overflow_policy = overflow_policy
+        self._workers = []
+        self._stats_task = None
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def start(self, process):
+        """Starts the workers; `process` is awaited once per queued message."""
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker(process)) for _ in range(self._worker_count)]
+        if INGEST_STATS_INTERVAL > 0:
+            self._stats_task = asyncio.create_task(self._log_stats_periodically())
+        logger.info(f"📥 Ingestion queue started: {self._worker_count} workers, capacity {self._queue.maxsize}, overflow policy '{self._overflow_policy}'.")
+
+    async def put(self, message: ChannelMessage, wait: bool = False):
+        """
+        Queues a message, applying the overflow policy when the queue is full.
+        With `wait` the caller always waits for room instead, which suits
+        producers that can slow down (like the catch-up fetch).
+        """
+        if self._queue.full() and not wait:
+            if self._overflow_policy == "drop_newest":
+                self._drop(message)
+                return
+            if self._overflow_policy == "drop_oldest":
+                try:
+                    self._drop(self._queue.get_nowait())
+                    self._queue.task_done()
+                except asyncio.QueueEmpty:
+                    pass
+        await self._queue.put(message)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _drop(self, message: ChannelMessage):
+        self.dropped += 1
+        logger.warning("🗑️ Ingestion queue full, dropped message %s from %s (total dropped: %d).", message.message_id, message.chat_id,
+                       self.dropped, extra={"message_id": message.message_id, "channel_id": message.chat_id})
+
+    async def _worker(self, process):
+        while True:
+            message = await self._queue.get()
+            try:
+                await process(message)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"⚠️ Error processing message {message.message_id} from {message.chat_id}: {e}")
+                logger.exception("Processing exception details:")
+            finally:
+                self._queue.task_done()
+
+    async def _log_stats_periodically(self):
+        last_enqueued = -1
+        while True:
+            await asyncio.sleep(INGEST_STATS_INTERVAL)
+            if self.enqueued != last_enqueued:
+                last_enqueued = self.enqueued
+                logger.info(f"📊 Ingestion queue: {self.format_stats()}")
+
+    def stats(self) -> dict:
+        """Returns the current queue counters."""
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "max_depth": self.max_depth,
+            "workers": len(self._workers),
+            "overflow_policy": self._overflow_policy,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    def format_stats(self) -> str:
+        """Returns the counters as a single log/reply line."""
+        return ", ".join(f"{key}={value}" for key, value in self.stats().items())
+
+    async def stop(self, timeout: float = 10):
+        """Waits up to `timeout` seconds for queued messages, then stops the workers."""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Stopping ingestion queue with {self._queue.qsize()} messages still queued.")
+        tasks = self._workers + ([self._stats_task] if self._stats_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._stats_task = None
+
+
+ingest_queue = IngestQueue(INGEST_QUEUE_SIZE, INGEST_WORKERS, INGEST_OVERFLOW_POLICY)
+gauge("ingest_queue_depth", "Channel messages waiting for a worker", lambda: ingest_queue._queue.qsize())
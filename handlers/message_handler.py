@@ -1,15 +1,9 @@
-import re
+import time
 
 from telethon import events
-from telethon.errors import (
-    ChannelPrivateError,
-    ChatForwardsRestrictedError,
-    ChatWriteForbiddenError,
-    UserNotParticipantError,
-)
 from telethon.tl.types import PeerChannel, PeerChat
 
-from client_setup import client  # Need client for forwarding
+from commands.backfill import handle_backfill
 from commands.channel import (
     handle_add_channel,
     handle_del_channel,
@@ -22,11 +16,44 @@ from commands.product import (
     handle_add_product,
     handle_del_product,
     handle_list_products,
+    handle_lowest,
+    handle_price_history,
+    handle_set_drop,
+    handle_set_target,
+    handle_stats,
+)
+from commands.route import (
+    handle_add_route,
+    handle_del_route,
+    handle_list_routes,
+    handle_tag,
+    handle_untag,
+)
+from commands.status import handle_metrics, handle_queue_stats
+from config import ADMIN_USER_ID, logger
+from data_manager import (
+    add_whitelist_listener,
+    find_matching_products,
+    get_whitelisted_channels,
+    is_channel_whitelisted,
 )
-from config import ADMIN_USER_ID, TARGET_FORWARD_CHANNEL_ID, logger
-from data_manager import get_wishlist, is_channel_whitelisted
-from db.db import add_price_record  # Direct DB interaction for price recording
-from utils import extract_price_from_text, is_multi_product_post
+from db.writer import price_writer  # Buffered DB writes for price recording
+from dedup import is_duplicate_promo
+from handlers.catch_up import high_water_marks
+from handlers.forwarder import ForwardJob, forwarder
+from handlers.ingest_queue import ChannelMessage, ingest_queue
+from metrics import counter, histogram
+from price_index import price_index
+from routes import route_table
+from segmenter import find_priced_products
+
+messages_processed = counter("promo_messages_total", "Whitelisted messages processed")
+multi_product_posts = counter("promo_multi_product_posts_total", "Messages with several selling prices, split per product")
+product_matches = counter("promo_product_matches_total", "Priced wishlist products found")
+price_misses = counter("promo_price_misses_total", "Wishlist products found in a message without a price")
+duplicates = counter("promo_duplicates_total", "Matching messages skipped as reposts of a recent promo")
+below_threshold = counter("promo_below_threshold_total", "Prices recorded but not forwarded because of a product threshold")
+process_seconds = histogram("promo_process_seconds", "Time to match, extract and record one message")
 
 
 async def handle_help_command(event):
@@ -39,13 +66,31 @@ async def handle_help_command(event):
     `/list_products`
     `/del_product <id>`
 
+    **Prices:**
+    `/price_history <id> [days]` - Daily min/avg/max prices.
+    `/lowest <id>` - Lowest price ever recorded.
+    `/stats` - Record totals and top channels.
+    `/set_target <id> <price|off>` - Only forward at or below a price.
+    `/set_drop <id> <percent|off>` - Only forward when X% below the recent minimum.
+    `/backfill <id|all> <days>` - Record prices from channel history (no forwarding).
+
+    **Routing:**
+    `/tag <id> <tag>` / `/untag <id> <tag>`
+    `/add_route <id|#tag> <channel_id>` - Forward a product or tag to a channel.
+    `/list_routes`
+    `/del_route <route_id>`
+
     **Channels:**
     `/add_channel <id>`
     `/list_channels`
     `/del_channel <id>`
 
     **UserBot Account Info:**
-    `/list_my_channels` - List channels the UserBot is in.
+    `/list_my_channels [whitelisted|unwhitelisted] [title]` - List channels the UserBot is in.
+
+    **Status:**
+    `/queue_stats` - Ingestion queue, forwarding and dedup counters.
+    `/metrics` - Per-stage counters and latencies.
 
     `/help` - Shows this message.
     """
@@ -70,6 +115,28 @@ async def process_admin_command(event):
             await handle_list_products(event)
         case '/del_product':
             await handle_del_product(event, args)
+        case '/price_history':
+            await handle_price_history(event, args)
+        case '/lowest':
+            await handle_lowest(event, args)
+        case '/stats':
+            await handle_stats(event)
+        case '/set_target':
+            await handle_set_target(event, args)
+        case '/set_drop':
+            await handle_set_drop(event, args)
+        case '/backfill':
+            await handle_backfill(event, args)
+        case '/tag':
+            await handle_tag(event, args)
+        case '/untag':
+            await handle_untag(event, args)
+        case '/add_route':
+            await handle_add_route(event, args)
+        case '/list_routes':
+            await handle_list_routes(event)
+        case '/del_route':
+            await handle_del_route(event, args)
         case '/add_channel':
             await handle_add_channel(event, args)
         case '/list_channels':
@@ -77,7 +144,11 @@ async def process_admin_command(event):
         case '/del_channel':
             await handle_del_channel(event, args)
         case '/list_my_channels':
-            await handle_list_my_channels(event)
+            await handle_list_my_channels(event, args)
+        case '/queue_stats':
+            await handle_queue_stats(event)
+        case '/metrics':
+            await handle_metrics(event)
         case '/help':
             await handle_help_command(event)
         case _:
@@ -85,112 +156,155 @@ async def process_admin_command(event):
 
 
 async def process_channel_message(event):
-    """Processes messages from channels/groups for promotions."""
-    channel_id = event.chat_id
+    """Queues a message from a whitelisted channel or group for promo processing."""
     peer_id = event.message.peer_id
-    resolved_id = None
-
-    if isinstance(peer_id, PeerChannel):
-        resolved_id = peer_id.channel_id
-        # Apply the -100 prefix convention if necessary for matching
-        if resolved_id > 0:
-             resolved_id = int(f"-100{resolved_id}")
-    elif isinstance(peer_id, PeerChat):
-        resolved_id = peer_id.chat_id 
-    else:
+    if not isinstance(peer_id, (PeerChannel, PeerChat)):
         return
 
-    if not is_channel_whitelisted(resolved_id):
-        return
+    resolved_id = event.chat_id # Marked peer ID, the form the whitelist is kept in
+    if not is_channel_whitelisted(resolved_id) or (_owns_peer and not _owns_peer(resolved_id)):
+        return # The chats filter normally stops these before the handler runs
 
     text = event.raw_text
     if not text:
         return
 
-    logger.info(f"🔔 New message {event.id} from whitelisted source {resolved_id}...")
+    # Already queued by the catch-up fetch
+    if not high_water_marks.claim(resolved_id, event.id):
+        return
+
+    await ingest_queue.put(ChannelMessage(
+        message_id=event.id,
+        chat_id=resolved_id,
+        peer=peer_id,
+        text=text,
+        date=event.message.date,
+    ))
+
+
+async def process_queued_message(message: ChannelMessage):
+    """Processes a queued message and moves its source's high-water mark."""
+    start = time.perf_counter()
+    try:
+        await process_promo(message)
+    finally:
+        high_water_marks.mark(message.chat_id, message.message_id)
+        messages_processed.inc()
+        process_seconds.observe(time.perf_counter() - start)
+
+
+async def process_promo(message: ChannelMessage):
+    """Looks for wishlist products in a queued channel message, records prices and forwards it."""
+    found = find_promo_products(message)
+    if found:
+        await record_promo(message, found)
+
+
+def find_promo_products(message: ChannelMessage) -> list:
+    """Returns the (product_id, product_name, price) of every priced wishlist product in a message."""
+    resolved_id = message.chat_id
+    text = message.text
 
-    # Skip posts likely containing multiple products
-    if is_multi_product_post(text):
-        logger.info(f"⏩ Skipping multi-product post from {resolved_id} (Msg ID: {event.id}).")
+    # Hot path: lazy %-style arguments, and ids as structured fields for JSON logs
+    ids = {"message_id": message.message_id, "channel_id": resolved_id}
+    logger.info("🔔 New message %s from whitelisted source %s...", message.message_id, resolved_id,
+                extra={**ids, "category": "new_message"})
+
+    result = find_priced_products(text, find_matching_products)
+    found = result.found # (product_id, product_name, price)
+    if result.multi_product:
+        # Posts with several products: pair each product with its own price
+        multi_product_posts.inc()
+        logger.info("🧩 Multi-product post from %s (Msg ID: %s): %d wishlist products priced.",
+                    resolved_id, message.message_id, len(found), extra=ids)
+    price_misses.inc(len(result.unpriced))
+    for product_name in result.unpriced:
+        logger.info("❓ Found '%s' in %s (Msg ID: %s), but no price extracted.", product_name, resolved_id, message.message_id,
+                    extra={**ids, "category": "no_price"})
+
+    return found
+
+
+async def record_promo(message: ChannelMessage, found: list, copy: bool = False):
+    """
+    Records the prices found in a promo and forwards it (as a plain-text copy
+    with `copy`) to the routes of the products whose price is good enough.
+    Reposts of a recent promo are skipped.
+    """
+    resolved_id = message.chat_id
+    text = message.text
+    ids = {"message_id": message.message_id, "channel_id": resolved_id}
+
+    if is_duplicate_promo(text):
+        duplicates.inc()
+        logger.info("♻️ Skipping duplicate of a recent promo from %s (Msg ID: %s).", resolved_id, message.message_id, extra=ids)
         return
 
-    message_already_forwarded = False
-    current_wishlist = get_wishlist() 
-
-    for product_id, product_name in current_wishlist:
-        product_words = product_name.split()
-        # Check if all words (case-insensitive, whole words) are present in the text
-        if product_words and all(re.search(r'\b' + re.escape(word) + r'\b', text, re.IGNORECASE) for word in product_words):
-            price = extract_price_from_text(text)
-            if price:
-                logger.info(f"✅ Found '{product_name}' (ID: {product_id}) for R${price} in source {resolved_id} (Msg ID: {event.id})")
-                try:
-                    add_price_record(
-                        product_id=product_id,
-                        price=price,
-                        currency="BRL", # Assuming BRL, could be made configurable
-                        source_msg=text[:1000], # Limit source message length
-                        channel=str(resolved_id)
-                    )
-                except Exception as e:
-                    logger.error(f"⚠️ Failed to add price record for product {product_id}: {e}")
-
-                if not message_already_forwarded and TARGET_FORWARD_CHANNEL_ID != 0:
-                    if not client or not client.is_connected():
-                         logger.error("🛑 Forwarding failed: Client is not connected.")
-                         continue
-
-                    try:
-                        logger.info(f"▶️ Attempting to forward message {event.id} from {resolved_id} to {TARGET_FORWARD_CHANNEL_ID}...")
-                        await client.forward_messages(
-                            entity=TARGET_FORWARD_CHANNEL_ID,
-                            messages=event.message,
-                            from_peer=event.chat
-                        )
-                        logger.info(f" relayed message {event.id} successfully.")
-                        message_already_forwarded = True
-                    except (UserNotParticipantError, ChannelPrivateError):
-                        logger.error(f"🛑 Forwarding failed: UserBot is not a participant in the target channel {TARGET_FORWARD_CHANNEL_ID} or channel is private.")
-                    except ChatWriteForbiddenError:
-                        logger.error(f"🛑 Forwarding failed: UserBot does not have permission to send messages in {TARGET_FORWARD_CHANNEL_ID}.")
-                    except ChatForwardsRestrictedError:
-                        logger.info(f"⚠️ Forwarding failed: UserBot cannot forward messages from {channel_id}. Coping the message instead...")
-                        try:
-                            await client.send_message(
-                                entity=TARGET_FORWARD_CHANNEL_ID,
-                                message=text
-                            )
-                            logger.info(f" relayed message {event.id} successfully.")
-                            message_already_forwarded = True
-                        except Exception as e:
-                            logger.error(f"🛑 Forwarding message {event.id} failed with unexpected error: {e}")
-                            logger.exception("Forwarding exception details:")
-                    except Exception as e:
-                        logger.error(f"🛑 Forwarding message {event.id} failed with unexpected error: {e}")
-                        logger.exception("Forwarding exception details:")
-
-
-                elif TARGET_FORWARD_CHANNEL_ID == 0:
-                     if not message_already_forwarded:
-                         logger.warning("⚠️ TARGET_FORWARD_CHANNEL_ID not set, skipping forward.")
-                         message_already_forwarded = True
-
-                # Once a product match is found and processed (incl. forwarding attempt), break the inner loop
-                break
-            else:
-                logger.info(f"❓ Found '{product_name}' in {resolved_id} (Msg ID: {event.id}), but no price extracted.")
-
-
-
-@events.register(events.NewMessage)
-async def main_event_handler(event):
-    """Main handler for all new messages."""
-    # 1. Handle commands from Admin User in private chat
-    if event.is_private and event.sender_id == ADMIN_USER_ID:
-        await process_admin_command(event)
+    product_matches.inc(len(found))
+    good_products = []
+    for product_id, product_name, price in found:
+        logger.info("✅ Found '%s' (ID: %s) for R$%s in source %s (Msg ID: %s)", product_name, product_id, price, resolved_id,
+                    message.message_id, extra={**ids, "product_id": product_id})
+        good_price, reason = price_index.is_good_price(product_id, price)
+        if good_price:
+            good_products.append(product_id)
+        else:
+            below_threshold.inc()
+            logger.info("📉 Price R$%s for '%s' (ID: %s) not good enough: %s.", price, product_name, product_id, reason,
+                        extra={**ids, "product_id": product_id})
+        price_index.record(product_id, price)
+        price_writer.add(
+            product_id=product_id,
+            price=price,
+            currency="BRL", # Assuming BRL, could be made configurable
+            source_msg=text, # Stored once per distinct text, compressed
+            channel=str(resolved_id),
+            message_id=message.message_id,
+        )
+
+    if not good_products:
         return
 
-    # 2. Handle messages from Channels and Groups
-    if event.is_channel or event.is_group:
-        await process_channel_message(event)
-        return
\ No newline at end of file
+    targets = route_table.targets_for(good_products)
+    if targets:
+        forwarder.submit(ForwardJob(
+            message_id=message.message_id,
+            chat_id=resolved_id,
+            peer=message.peer,
+            text=text,
+            copy=copy,
+        ), targets)
+    else:
+        logger.warning("⚠️ No forward route for products %s and TARGET_FORWARD_CHANNEL_ID not set, skipping forward.",
+                       good_products, extra=ids)
+
+
+# The whitelist is pushed down into the event registration: Telethon checks
+# event.chat_id against `chats` before scheduling the handler, so the many
+# updates from groups we don't follow never reach our code.
+channel_events = events.NewMessage(chats=[])
+admin_events = events.NewMessage(from_users=ADMIN_USER_ID, func=lambda event: event.is_private)
+_owns_peer = None # In supervisor worker processes: tells which whitelisted peers this process reads
+
+def sync_channel_filter():
+    """Points the chats filter of channel_events at the current whitelist (or this process' share of it)."""
+    peers = get_whitelisted_channels()
+    channel_events.chats = set(peers if _owns_peer is None else filter(_owns_peer, peers))
+
+def set_peer_partition(owns_peer):
+    """Restricts this process to the whitelisted peers for which `owns_peer(peer_id)` is True."""
+    global _owns_peer
+    _owns_peer = owns_peer
+    sync_channel_filter()
+
+add_whitelist_listener(sync_channel_filter)
+sync_channel_filter()
+
+
+async def admin_event_handler(event):
+    """Handles private messages from the admin user."""
+    await process_admin_command(event)
+
+async def channel_event_handler(event):
+    """Handles new messages from whitelisted channels and groups."""
+    await process_channel_message(event)
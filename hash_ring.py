@@ -0,0 +1,36 @@
+import hashlib
+from bisect import bisect, insort
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring. Each node is placed on the ring `replicas` times, and
+    a key belongs to the first node point at or after its own hash. Adding a
+    node only moves the keys its points take over (about 1/N of them); every
+    other key keeps its owner.
+    """
+
+    def __init__(self, nodes=(), replicas: int = 100):
+        self._replicas = replicas
+        self._points = []   # sorted hashes
+        self._owners = {}   # hash -> node
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        for replica in range(self._replicas):
+            point = _hash(f"{node}#{replica}")
+            if point not in self._owners:
+                self._owners[point] = node
+                insort(self._points, point)
+
+    def node_for(self, key):
+        """Returns the node owning a key (any value with a stable str()), or None for an empty ring."""
+        if not self._points:
+            return None
+        index = bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[self._points[index]]
@@ -0,0 +1,84 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Attributes passed with extra={...} that the JSON formatter copies to its output
+STRUCTURED_FIELDS = ("message_id", "channel_id", "product_id", "category")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the ids given through `extra` as separate keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps 1 of every N records of each sampled category (extra={"category": ...})."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self._rates = {category: every for category, every in rates.items() if every > 1}
+        self._seen = dict.fromkeys(self._rates, 0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        every = self._rates.get(category)
+        if every is None:
+            return True
+        self._seen[category] += 1
+        return self._seen[category] % every == 1
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread untouched. The stock QueueHandler
+    formats the message before queueing it, which is the work this handler
+    exists to move off the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level=logging.INFO, log_format: str = "text", use_queue: bool = True, sample_rates=None):
+    """
+    Configures the root logger. With `use_queue` records are only queued on
+    the calling thread; a listener thread formats and writes them. Records of
+    the categories in `sample_rates` ({category: N}) are kept 1 in N times.
+    """
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = stream_handler
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue)
+        listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop) # Flushes what is still queued on exit
+
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
@@ -0,0 +1,220 @@
+import re
+import unicodedata
+from string import ascii_lowercase
+
+_TOKEN_RE = re.compile(r"\w+")
+# Runs of letters or numbers (with decimal separators), so "510bt" is "510" + "bt"
+_NORMALIZED_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:[.,]\d+)*")
+
+# Units joined to the number right before them in normalized mode
+UNITS = {"gb", "tb", "mb", "mah", "w", "v", "hz", "mm", "cm", "m", "l", "ml", "kg", "g", "mp", "k", "pol"}
+UNIT_ALIASES = {"polegadas": "pol", "polegada": "pol", "litros": "l", "litro": "l", "gigas": "gb", "giga": "gb"}
+
+
+def _is_plain_word(word: str) -> bool:
+    """Returns True if the word is a single run of word characters."""
+    return _TOKEN_RE.fullmatch(word) is not None
+
+
+class WishlistMatcher:
+    """
+    Inverted index over the wishlist product names.
+
+    A product matches a message when all of its words appear in the text as
+    whole words, case-insensitively (the same rule as matching every word with
+    r'\\bword\\b' and re.IGNORECASE). Plain words are looked up in the token set
+    of the message, so the text is tokenized once regardless of wishlist size.
+    Words containing punctuation keep a regex, compiled once when the product
+    is added.
+    """
+
+    def __init__(self, wishlist=()):
+        self._order = {}          # product_id -> insertion position
+        self._required = {}       # product_id -> tuple of distinct plain tokens
+        self._patterns = {}       # product_id -> tuple of compiled patterns
+        self._negatives = {}      # product_id -> frozenset of tokens that veto a match
+        self._index = {}          # token -> set of product_ids
+        self._unindexed = set()   # products without plain tokens
+        self._next_position = 0
+        for product_id, product_name in wishlist:
+            self.add_product(product_id, product_name)
+
+    def __len__(self):
+        return len(self._order)
+
+    def _parse_name(self, product_name: str):
+        """Returns the (tokens, patterns, negative tokens) a product name requires."""
+        tokens = set()
+        patterns = []
+        for word in product_name.split():
+            if _is_plain_word(word):
+                tokens.add(word.lower())
+            else:
+                patterns.append(re.compile(r'\b' + re.escape(word) + r'\b', re.IGNORECASE))
+        return tokens, patterns, frozenset()
+
+    def _tokenize(self, text: str) -> set:
+        return set(_TOKEN_RE.findall(text.lower()))
+
+    def add_product(self, product_id: int, product_name: str):
+        """Adds (or replaces) a product in the index."""
+        if product_id in self._order:
+            self.remove_product(product_id)
+
+        tokens, patterns, negatives = self._parse_name(product_name)
+        if not tokens and not patterns:
+            return
+
+        self._order[product_id] = self._next_position
+        self._next_position += 1
+        self._required[product_id] = tuple(tokens) # Tuples (un)pickle much faster than frozensets
+        self._patterns[product_id] = tuple(patterns)
+        if negatives:
+            self._negatives[product_id] = negatives
+        if tokens:
+            for token in tokens:
+                self._index.setdefault(token, set()).add(product_id)
+        else:
+            self._unindexed.add(product_id)
+
+    def remove_product(self, product_id: int):
+        """Removes a product from the index, if present."""
+        if self._order.pop(product_id, None) is None:
+            return
+        for token in self._required.pop(product_id):
+            product_ids = self._index.get(token)
+            if product_ids is not None:
+                product_ids.discard(product_id)
+                if not product_ids:
+                    del self._index[token]
+        self._patterns.pop(product_id, None)
+        self._negatives.pop(product_id, None)
+        self._unindexed.discard(product_id)
+
+    def match(self, text: str) -> list[int]:
+        """Returns the IDs of all products matching the text, in wishlist order."""
+        if not text or not self._order:
+            return []
+
+        text_tokens = self._tokenize(text)
+        hits = {}
+        for token in text_tokens:
+            for product_id in self._index.get(token, ()):
+                hits[product_id] = hits.get(product_id, 0) + 1
+
+        candidates = [pid for pid, count in hits.items() if count == len(self._required[pid])]
+        candidates.extend(self._unindexed)
+
+        matches = [
+            pid for pid in candidates
+            if all(pattern.search(text) for pattern in self._patterns[pid])
+            and not (pid in self._negatives and self._negatives[pid] & text_tokens)
+        ]
+        matches.sort(key=self._order.__getitem__)
+        return matches
+
+
+class NormalizedMatcher(WishlistMatcher):
+    """
+    Fuzzier variant of WishlistMatcher for MATCH_MODE=normalized.
+
+    Product names and messages go through the same normalization: casefold,
+    accents stripped, letters split from digits and a number joined with the
+    unit that follows it ("128GB", "128 gb" and "128 GB" all become "128gb";
+    in a message, "128" and "gb" are kept too, so nothing exact mode finds
+    is missed),
+    then synonyms (words or phrases, "playstation 5: ps5") mapped to their
+    canonical form. Product words starting with "-" are negative keywords:
+    "iphone 15 -capa" never matches a post that mentions "capa". Global
+    negative keywords apply to every product that doesn't itself contain the
+    word. Punctuation is never significant, so every product is served by
+    the token index alone.
+    """
+
+    def __init__(self, wishlist=(), synonyms=None, negative_keywords=()):
+        # Variants and canonicals are split like any other text, so "ps5" is
+        # ("ps", "5") and "playstation 5" maps to it as a token sequence.
+        # Entries left with no token (only punctuation or emoji) are skipped.
+        self._synonyms = {} # first variant token -> ((variant tokens, canonical tokens), ...), longest first
+        for variant, canonical in (synonyms or {}).items():
+            variant_tokens, canonical_tokens = tuple(self._split(variant)), tuple(self._split(canonical))
+            if variant_tokens and canonical_tokens and variant_tokens != canonical_tokens:
+                self._synonyms.setdefault(variant_tokens[0], []).append((variant_tokens, canonical_tokens))
+        for entries in self._synonyms.values():
+            entries.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self._global_negatives = frozenset(self._normalize(" ".join(negative_keywords)))
+        super().__init__(wishlist)
+
+    def _split(self, text: str) -> list:
+        # NFKD splits accented letters into letter + combining mark; the ASCII
+        # encode then drops the marks (and emoji) in C instead of a Python loop
+        ascii_text = unicodedata.normalize("NFKD", text.casefold()).encode("ascii", "ignore").decode()
+        tokens = []
+        for token in _NORMALIZED_TOKEN_RE.findall(ascii_text):
+            if token[0].isdigit():
+                token = token.replace(",", ".")
+            else:
+                token = UNIT_ALIASES.get(token, token)
+                if token in UNITS and tokens and tokens[-1][-1].isdigit():
+                    tokens[-1] += token
+                    continue
+            tokens.append(token)
+        return tokens
+
+    def _normalize(self, text: str) -> list:
+        tokens = self._split(text)
+        if not self._synonyms:
+            return tokens
+        synonyms = self._synonyms
+        mapped = []
+        position = 0
+        while position < len(tokens):
+            for variant, canonical in synonyms.get(tokens[position], ()):
+                if tuple(tokens[position:position + len(variant)]) == variant:
+                    mapped.extend(canonical)
+                    position += len(variant)
+                    break
+            else:
+                mapped.append(tokens[position])
+                position += 1
+        return mapped
+
+    def _parse_name(self, product_name: str):
+        words = product_name.split()
+        negatives = set(self._normalize(" ".join(word[1:] for word in words if word.startswith("-") and len(word) > 1)))
+        tokens = set(self._normalize(" ".join(word for word in words if not word.startswith("-"))))
+        negatives |= self._global_negatives - tokens
+        return tokens, [], frozenset(negatives)
+
+    def _tokenize(self, text: str) -> set:
+        tokens = set(self._normalize(text))
+        # The parts of a joined number count on their own as well, so whatever
+        # exact mode finds is still found: "kindle 16" in "Kindle 16 GB" (number
+        # and unit) and "3" or "149,10" in "R$ 3.149,10" (runs of digit groups)
+        for token in [token for token in tokens if token[0].isdigit()]:
+            number = token.rstrip(ascii_lowercase)
+            if number != token:
+                tokens.add(number)
+                tokens.add(token[len(number):])
+            if "." in number:
+                groups = number.split(".")
+                tokens.update(".".join(groups[i:j]) for i in range(len(groups)) for j in range(i + 1, len(groups) + 1))
+        return tokens
+
+
+def load_synonyms(path: str) -> dict:
+    """
+    Reads a synonyms file: one 'canonical: variant, variant' group per line,
+    '#' starts a comment. Returns {variant: canonical}.
+    """
+    synonyms = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            canonical, variants = line.split(":", 1)
+            for variant in variants.split(","):
+                if variant.strip():
+                    synonyms[variant.strip()] = canonical.strip()
+    return synonyms
@@ -0,0 +1,59 @@
+import gc
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+
+# File layout: magic, header (format version, data version, fingerprint),
+# then the pickled state. The header is checked straight from the memory
+# map, so a stale snapshot costs a few bytes of I/O; a current one is
+# unpickled from the map without copying the file into memory first.
+MAGIC = b"PROMOSNP"
+FORMAT_VERSION = 2 # Bump whenever the pickled state or the matcher classes change
+_HEADER = struct.Struct(">HQ32s")
+_PAYLOAD_START = len(MAGIC) + _HEADER.size
+
+
+def fingerprint(*settings) -> bytes:
+    """Digest of the settings the matcher was built with (mode, synonyms, ...)."""
+    return hashlib.sha256(repr(settings).encode()).digest()
+
+def save_snapshot(path: str, data_version: int, settings_fingerprint: bytes, state):
+    """Writes the state atomically, so a crash never leaves a half-written snapshot behind."""
+    temp_path = f"{path}.{os.getpid()}.tmp" # Supervisor workers may save at the same time
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC + _HEADER.pack(FORMAT_VERSION, data_version, settings_fingerprint))
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def load_snapshot(path: str, data_version: int, settings_fingerprint: bytes):
+    """
+    Returns the saved state if the snapshot was written for this data version
+    and these settings, otherwise None. The snapshot is a local file written
+    by the bot itself, trusted like the database next to it.
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < _PAYLOAD_START or mapped[:len(MAGIC)] != MAGIC:
+                return None
+            if _HEADER.unpack_from(mapped, len(MAGIC)) != (FORMAT_VERSION, data_version, settings_fingerprint):
+                return None
+            # The state is hundreds of thousands of small containers, none of
+            # them cyclic; collections triggered while they are created only
+            # slow the load down (by more than half)
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                with memoryview(mapped) as view:
+                    return pickle.loads(view[_PAYLOAD_START:])
+            finally:
+                if gc_enabled:
+                    gc.enable()
+    except Exception:
+        return None # Missing, empty or unreadable: the caller rebuilds from the database
@@ -0,0 +1,159 @@
+import asyncio
+from bisect import bisect_left
+
+from config import METRICS_ENABLED, logger
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+_counters = {}
+_histograms = {}
+_gauges = {}
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Histogram:
+    """Latency histogram with fixed buckets; observe() is a bisect and two additions."""
+
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-quantile, or None without samples."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Disabled:
+    """Shared stand-in returned when metrics are off, so instrumented code pays one no-op call."""
+
+    __slots__ = ()
+
+    def inc(self, amount: int = 1):
+        pass
+
+    def observe(self, seconds: float):
+        pass
+
+
+_DISABLED = _Disabled()
+
+
+def counter(name: str, help: str):
+    """Returns the counter registered under `name`, creating it on first use."""
+    if not METRICS_ENABLED:
+        return _DISABLED
+    if name not in _counters:
+        _counters[name] = Counter(name, help)
+    return _counters[name]
+
+def histogram(name: str, help: str):
+    """Returns the latency histogram registered under `name`, creating it on first use."""
+    if not METRICS_ENABLED:
+        return _DISABLED
+    if name not in _histograms:
+        _histograms[name] = Histogram(name, help)
+    return _histograms[name]
+
+def gauge(name: str, help: str, read):
+    """Registers a gauge whose value is read (by calling `read`) only when metrics are rendered."""
+    if METRICS_ENABLED:
+        _gauges[name] = (help, read)
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "n/a"
+    if seconds == float("inf"):
+        return f">{LATENCY_BUCKETS[-1]}s"
+    return f"≤{seconds * 1000:g}ms"
+
+def format_summary() -> str:
+    """Returns every metric as a human readable reply."""
+    lines = ["📈 Counters:"]
+    lines += [f"- {c.name}: `{c.value}`" for c in _counters.values()]
+    if _gauges:
+        lines.append("\n📏 Gauges:")
+        lines += [f"- {name}: `{read()}`" for name, (_, read) in _gauges.items()]
+    lines.append("\n⏱️ Latencies (p50 / p99, avg):")
+    for h in _histograms.values():
+        average = f"{h.sum / h.count * 1000:.2f}ms" if h.count else "n/a"
+        lines.append(f"- {h.name}: `{_format_seconds(h.quantile(0.5))} / {_format_seconds(h.quantile(0.99))}`, avg `{average}` ({h.count} samples)")
+    return "\n".join(lines)
+
+def format_prometheus() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for c in _counters.values():
+        lines += [f"# HELP {c.name} {c.help}", f"# TYPE {c.name} counter", f"{c.name} {c.value}"]
+    for name, (help, read) in _gauges.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {read()}"]
+    for h in _histograms.values():
+        lines += [f"# HELP {h.name} {h.help}", f"# TYPE {h.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(h.buckets, h.counts):
+            cumulative += count
+            lines.append(f'{h.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{h.name}_bucket{{le="+Inf"}} {h.count}')
+        lines += [f"{h.name}_sum {h.sum}", f"{h.name}_count {h.count}"]
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", format_prometheus().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.warning(f"⚠️ Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+async def start_http_server(host: str, port: int):
+    """Serves GET /metrics in the Prometheus format. Returns the server, or None if disabled or failed."""
+    if not METRICS_ENABLED or not port:
+        return None
+    try:
+        server = await asyncio.start_server(_handle_http, host, port)
+    except OSError as e:
+        logger.error(f"⚠️ Could not start metrics endpoint on {host}:{port}: {e}")
+        return None
+    logger.info(f"📈 Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,17 @@
+from telethon import utils
+from telethon.tl.types import PeerChannel, PeerChat
+
+# Every ID kept in memory is Telethon's "marked" peer ID (channels -100...,
+# basic groups -chat_id), the same value as event.chat_id, so a lookup never
+# needs a conversion. The whitelist table may hold bare positive IDs.
+
+
+def channel_peer_id(channel_id: int) -> int:
+    """Returns the marked peer ID of a channel given with or without the -100 prefix."""
+    return utils.get_peer_id(PeerChannel(channel_id)) if channel_id > 0 else channel_id
+
+def whitelist_peer_ids(channel_id: int) -> set:
+    """Returns the marked peer IDs a whitelisted ID stands for; a bare positive ID may be a channel or a basic group."""
+    if channel_id > 0:
+        return {utils.get_peer_id(PeerChannel(channel_id)), utils.get_peer_id(PeerChat(channel_id))}
+    return {channel_id}
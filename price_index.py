@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone
+
+from config import PRICE_WINDOW_DAYS, logger
+from db import async_db
+
+
+def _today() -> str:
+    # Same calendar as SQLite's date('now') used by the daily rollups
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class PriceIndex:
+    """
+    In-memory per-product daily minimum prices over the last `window_days`
+    days, plus each product's alert thresholds, so deciding whether a new
+    price is worth forwarding needs no database query.
+    """
+
+    def __init__(self, window_days: int):
+        self._window_days = window_days
+        self._daily_mins = {}  # product_id -> {day: min_price}
+        self._window_min = {}  # product_id -> min over the window
+        self._thresholds = {}  # product_id -> (target_price, drop_percent)
+        self._day = _today()
+
+    def load(self, daily_mins, thresholds):
+        """Replaces the index with (product_id, day, min_price) and (product_id, target, percent) rows."""
+        self._daily_mins = {}
+        for product_id, day, min_price in daily_mins:
+            days = self._daily_mins.setdefault(product_id, {})
+            days[day] = min(min_price, days.get(day, min_price))
+        self._thresholds = {product_id: (target, percent) for product_id, target, percent in thresholds}
+        self._day = _today()
+        self._rebuild_window()
+
+    def _rebuild_window(self):
+        oldest = (datetime.fromisoformat(self._day) - timedelta(days=self._window_days - 1)).date().isoformat()
+        for product_id, days in list(self._daily_mins.items()):
+            for day in [day for day in days if day < oldest]:
+                del days[day]
+            if not days:
+                del self._daily_mins[product_id]
+        self._window_min = {product_id: min(days.values()) for product_id, days in self._daily_mins.items()}
+
+    def _roll_day(self):
+        today = _today()
+        if today != self._day:
+            self._day = today
+            self._rebuild_window()
+
+    def window_min(self, product_id):
+        """Returns the lowest price seen for a product within the window, or None."""
+        self._roll_day()
+        return self._window_min.get(product_id)
+
+    def record(self, product_id: int, price: float):
+        """Adds a newly seen price."""
+        self._roll_day()
+        days = self._daily_mins.setdefault(product_id, {})
+        days[self._day] = min(price, days.get(self._day, price))
+        current = self._window_min.get(product_id)
+        self._window_min[product_id] = price if current is None else min(current, price)
+
+    def set_thresholds(self, product_id: int, target_price=None, drop_percent=None):
+        """Sets a product's alert thresholds; with neither set, every price is forwarded."""
+        if target_price is None and drop_percent is None:
+            self._thresholds.pop(product_id, None)
+        else:
+            self._thresholds[product_id] = (target_price, drop_percent)
+
+    def get_thresholds(self, product_id: int):
+        """Returns (target_price, drop_percent) for a product."""
+        return self._thresholds.get(product_id, (None, None))
+
+    def remove_product(self, product_id: int):
+        self._daily_mins.pop(product_id, None)
+        self._window_min.pop(product_id, None)
+        self._thresholds.pop(product_id, None)
+
+    def is_good_price(self, product_id: int, price: float):
+        """
+        Returns (forward, reason). Call before record() so the price is
+        compared with the previous minimum.
+        """
+        target_price, drop_percent = self._thresholds.get(product_id, (None, None))
+        if target_price is None and drop_percent is None:
+            return True, "no threshold set"
+        if target_price is not None and price <= target_price:
+            return True, f"at or below target R${target_price:.2f}"
+        if drop_percent is not None:
+            minimum = self.window_min(product_id)
+            if minimum is None:
+                return True, f"first price in {self._window_days} days"
+            limit = minimum * (1 - drop_percent / 100)
+            if price <= limit:
+                return True, f"{drop_percent:g}% below the {self._window_days}-day minimum R${minimum:.2f}"
+            return False, f"above R${limit:.2f} ({drop_percent:g}% below the {self._window_days}-day minimum)"
+        return False, f"above target R${target_price:.2f}"
+
+
+price_index = PriceIndex(PRICE_WINDOW_DAYS)
+
+
+async def load_price_index():
+    """Seeds the price index from the daily rollups and product thresholds."""
+    try:
+        daily_mins = await async_db.get_recent_daily_mins(PRICE_WINDOW_DAYS)
+        thresholds = await async_db.list_price_thresholds()
+    except Exception as e:
+        logger.error(f"⚠️ Error loading price index from DB: {e}")
+        return
+    price_index.load(daily_mins, thresholds)
+    logger.info(f"🏷️ Price index loaded: {len(daily_mins)} daily minimums, {len(thresholds)} products with thresholds.")
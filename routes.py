@@ -0,0 +1,93 @@
+from config import TARGET_FORWARD_CHANNEL_ID, logger
+from db import async_db
+
+
+class RouteTable:
+    """
+    In-memory copy of the forward routes and product tags. A product is sent
+    to the targets of its own routes plus those of its tags' routes; products
+    without any route go to `default_target` (if set). The targets of every
+    product are precomputed, so resolving a match is a dict lookup per
+    product.
+    """
+
+    def __init__(self, default_target: int):
+        self._default = frozenset([default_target]) if default_target else frozenset()
+        self._routes = {}           # route_id -> (product_id, tag, target_id)
+        self._tags = {}             # product_id -> set of tags
+        self._product_targets = {}  # product_id -> frozenset of targets, for products with routes
+
+    def load(self, routes, tags):
+        """Replaces the table with (id, product_id, tag, target_id) and (product_id, tag) rows."""
+        self._routes = {route_id: (product_id, tag, target_id) for route_id, product_id, tag, target_id in routes}
+        self._tags = {}
+        for product_id, tag in tags:
+            self._tags.setdefault(product_id, set()).add(tag)
+        self._rebuild()
+
+    def _rebuild(self):
+        by_tag = {}
+        targets = {}
+        for product_id, tag, target_id in self._routes.values():
+            if tag is None:
+                targets.setdefault(product_id, set()).add(target_id)
+            else:
+                by_tag.setdefault(tag, set()).add(target_id)
+        for product_id, tags in self._tags.items():
+            for tag in tags & by_tag.keys():
+                targets.setdefault(product_id, set()).update(by_tag[tag])
+        self._product_targets = {product_id: frozenset(ids) for product_id, ids in targets.items()}
+
+    def targets_for(self, product_ids) -> set:
+        """Returns the target channels a message with these products is sent to."""
+        targets = set()
+        for product_id in product_ids:
+            targets |= self._product_targets.get(product_id, self._default)
+        return targets
+
+    def all_targets(self) -> set:
+        """Returns every target channel in use, including the default."""
+        return set(self._default).union(target_id for _, _, target_id in self._routes.values())
+
+    def routes(self):
+        """Returns (id, product_id, tag, target_id) for every route."""
+        return [(route_id, *route) for route_id, route in self._routes.items()]
+
+    def get_tags(self, product_id: int):
+        return sorted(self._tags.get(product_id, ()))
+
+    def add_route(self, route_id: int, product_id, tag, target_id: int):
+        self._routes[route_id] = (product_id, tag, target_id)
+        self._rebuild()
+
+    def remove_route(self, route_id: int):
+        self._routes.pop(route_id, None)
+        self._rebuild()
+
+    def add_tag(self, product_id: int, tag: str):
+        self._tags.setdefault(product_id, set()).add(tag)
+        self._rebuild()
+
+    def remove_tag(self, product_id: int, tag: str):
+        self._tags.get(product_id, set()).discard(tag)
+        self._rebuild()
+
+    def remove_product(self, product_id: int):
+        self._tags.pop(product_id, None)
+        self._routes = {route_id: route for route_id, route in self._routes.items() if route[0] != product_id}
+        self._rebuild()
+
+
+route_table = RouteTable(TARGET_FORWARD_CHANNEL_ID)
+
+
+async def load_routes():
+    """Seeds the route table from the forward routes and product tags."""
+    try:
+        routes = await async_db.list_forward_routes()
+        tags = await async_db.list_product_tags()
+    except Exception as e:
+        logger.error(f"⚠️ Error loading forward routes from DB: {e}")
+        return
+    route_table.load(routes, tags)
+    logger.info(f"🧭 Route table loaded: {len(routes)} routes, {len(tags)} product tags.")
@@ -12,6 +12,7 @@ from db.db import (
     list_products,
     list_whitelisted_channels,
 )
+from peer_ids import whitelist_peer_ids
 
 load_dotenv()
 api_id = int(os.getenv("API_ID"))
@@ -85,16 +86,17 @@ def handle_delete_channel():
 
 async def handle_list_telegram_channels():
     await client.start()
-    dialogs = await client.get_dialogs()
-    whitelisted = list_whitelisted_channels()
+    whitelisted = set()
+    for channel_id in list_whitelisted_channels():
+        whitelisted |= whitelist_peer_ids(channel_id)
     
     print("\n📢 Telegram Channels You’re In:")
-    for dialog in dialogs:
+    async for dialog in client.iter_dialogs():
         entity = dialog.entity
         if hasattr(entity, 'megagroup') or hasattr(entity, 'broadcast'):
             name = getattr(entity, "title", "No Title")
             cid = entity.id
-            mark = "✅" if cid in whitelisted else "❌"
+            mark = "✅" if dialog.id in whitelisted else "❌"
             print(f"{mark} [{cid}] {name}")
 
 def main():
@@ -0,0 +1,128 @@
+from typing import NamedTuple
+
+from utils import PRICE_INSTALLMENT, PRICE_LIST, PriceMatch, best_price, has_multiple_offers, scan_prices
+
+
+class PricedProducts(NamedTuple):
+    found: list          # (product_id, product_name, price)
+    unpriced: list       # Names of products matched in a post without a price
+    multi_product: bool
+
+
+def _split_lines(text: str):
+    """Returns (start, end) offsets of every line in the text."""
+    lines = []
+    start = 0
+    for line in text.split("\n"):
+        end = start + len(line)
+        lines.append((start, end))
+        start = end + 1
+    return lines
+
+def _split_blocks(text: str, lines):
+    """Groups line indexes into blocks separated by blank lines."""
+    blocks = []
+    current = []
+    for index, (start, end) in enumerate(lines):
+        if text[start:end].strip():
+            current.append(index)
+        elif current:
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return blocks
+
+def _is_selling_price(price: PriceMatch) -> bool:
+    return price.kind not in (PRICE_LIST, PRICE_INSTALLMENT)
+
+def find_products_per_segment(text: str, prices: list[PriceMatch], match_products):
+    """
+    Pairs the products of a multi-product post with their own prices.
+
+    The post is split into blocks at blank lines. A block with a single selling
+    price gives it to every product it mentions; a block with several is
+    resolved line by line, each product line taking the price on the same line
+    or else the nearest line with a selling price (the following one on ties).
+    Lines, blocks and prices are each walked once, and every line is matched
+    at most once.
+
+    `prices` is the scan_prices() result for the text and `match_products`
+    returns (product_id, product_name) pairs for a piece of text. Returns a
+    list of (product_id, product_name, price), each product at most once.
+    """
+    lines = _split_lines(text)
+
+    # Walk lines and (ordered) prices together to bucket prices per line
+    line_prices = [[] for _ in lines]
+    line_index = 0
+    for price in prices:
+        while lines[line_index][1] < price.start:
+            line_index += 1
+        line_prices[line_index].append(price)
+
+    found = []
+    seen = set()
+
+    def add(matches, price):
+        for product_id, product_name in matches:
+            if product_id not in seen:
+                seen.add(product_id)
+                found.append((product_id, product_name, price))
+
+    for block in _split_blocks(text, lines):
+        block_prices = [price for index in block for price in line_prices[index]]
+        selling = [price for price in block_prices if _is_selling_price(price)]
+        if not selling:
+            continue
+
+        if len(selling) == 1:
+            block_text = text[lines[block[0]][0]:lines[block[-1]][1]]
+            add(match_products(block_text), best_price(block_prices))
+            continue
+
+        price_lines = [index for index in block if any(_is_selling_price(p) for p in line_prices[index])]
+        next_price = 0 # Position in price_lines of the first price line at or after the current line
+        for index in block:
+            while next_price < len(price_lines) and price_lines[next_price] < index:
+                next_price += 1
+            matches = match_products(text[lines[index][0]:lines[index][1]])
+            if not matches:
+                continue
+
+            if next_price < len(price_lines) and price_lines[next_price] == index:
+                nearest = index
+            else:
+                before = price_lines[next_price - 1] if next_price > 0 else None
+                after = price_lines[next_price] if next_price < len(price_lines) else None
+                if before is None or (after is not None and after - index <= index - before):
+                    nearest = after
+                else:
+                    nearest = before
+            add(matches, best_price(line_prices[nearest]))
+
+    return found
+
+def find_priced_products(text: str, match_products) -> PricedProducts:
+    """
+    Finds the wishlist products of a promo and the price each is sold for.
+
+    Posts with several selling prices are resolved per segment. Otherwise the
+    single best price goes to the first matching product. `match_products`
+    returns (product_id, product_name) pairs for a piece of text.
+    """
+    # One scan gives both the multi-product check and the prices
+    prices = scan_prices(text)
+    if has_multiple_offers(prices):
+        return PricedProducts(find_products_per_segment(text, prices, match_products), [], True)
+
+    # All words of a product must be present (case-insensitive, whole words)
+    matches = match_products(text)
+    if not matches:
+        return PricedProducts([], [], False)
+    price = best_price(prices)
+    if price:
+        # Once a product match is found, stop looking
+        product_id, product_name = matches[0]
+        return PricedProducts([(product_id, product_name, price)], [], False)
+    return PricedProducts([], [product_name for _, product_name in matches], False)
@@ -0,0 +1,258 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+from client_setup import client, connect_client, disconnect_client
+from commands.status import set_worker_count
+from config import (
+    ADMIN_USER_ID,
+    API_HASH,
+    API_ID,
+    CATCHUP_ENABLED,
+    HASH_RING_REPLICAS,
+    WORKER_RESTART_DELAY,
+    WORKER_SESSIONS,
+    logger,
+)
+from data_manager import add_change_listener, reload_data
+from db.async_db import close_db, run_db
+from db.migrations import run_migrations
+from db.retention import source_retention
+from db.writer import price_writer
+from entity_cache import entity_cache
+from handlers.catch_up import catch_up, high_water_marks
+from handlers.forwarder import forwarder
+from handlers.ingest_queue import ChannelMessage, ingest_queue
+from handlers.message_handler import (
+    admin_event_handler,
+    admin_events,
+    channel_event_handler,
+    channel_events,
+    find_promo_products,
+    record_promo,
+    set_peer_partition,
+)
+from hash_ring import HashRing
+from price_index import load_price_index
+from routes import load_routes
+
+# Supervisor mode: one worker process per WORKER_SESSIONS account reads its
+# share of the whitelisted channels (split with a consistent hash ring) and
+# does the matching. Matches come back over a multiprocessing queue to this
+# process, which alone dedups, records prices and forwards, with the
+# STRING_SESSION account that also takes the admin commands.
+#
+# Run instead of bot.py:
+#     python supervisor.py
+
+WORKER_CHECK_INTERVAL = 5 # Seconds between worker liveness checks
+
+
+def _owner_check(index: int, worker_count: int):
+    ring = HashRing(range(worker_count), HASH_RING_REPLICAS)
+    return lambda peer_id: ring.node_for(peer_id) == index
+
+def _get_or_none(ipc_queue):
+    # Short timeout so a reader thread never outlives the event loop for long
+    try:
+        return ipc_queue.get(timeout=1)
+    except queue.Empty:
+        return None
+
+
+# --- Worker process ---
+
+async def _follow_control(control_queue, worker_client):
+    """Applies the supervisor's commands: 'reload' after a wishlist/whitelist change, 'stop' to exit."""
+    loop = asyncio.get_running_loop()
+    while True:
+        command = await loop.run_in_executor(None, _get_or_none, control_queue)
+        if command == "reload":
+            await reload_data()
+        elif command == "stop":
+            await worker_client.disconnect()
+            return
+
+async def _worker_main(index: int, session: str, worker_count: int, match_queue, control_queue):
+    owns_peer = _owner_check(index, worker_count)
+    await reload_data()
+    await high_water_marks.load()
+    set_peer_partition(owns_peer)
+
+    worker_client = TelegramClient(StringSession(session), API_ID, API_HASH)
+    await worker_client.connect()
+    if not await worker_client.is_user_authorized():
+        logger.error(f"🛑 Worker {index}: session not authorized, exiting.")
+        await worker_client.disconnect()
+        return
+    # Access hashes are per account, so the worker fills its own entity cache
+    # instead of reusing the shared one
+    await worker_client.get_dialogs()
+
+    async def process(message: ChannelMessage):
+        try:
+            found = find_promo_products(message)
+            if found:
+                match_queue.put((message.message_id, message.chat_id, message.text, found))
+        finally:
+            high_water_marks.mark(message.chat_id, message.message_id)
+
+    high_water_marks.start()
+    ingest_queue.start(process)
+    worker_client.add_event_handler(channel_event_handler, channel_events)
+    logger.info(f"👷 Worker {index} listening to {len(channel_events.chats)} peer IDs.")
+
+    control_task = asyncio.create_task(_follow_control(control_queue, worker_client))
+    catch_up_task = asyncio.create_task(catch_up(worker_client, owns_peer)) if CATCHUP_ENABLED else None
+    try:
+        await worker_client.run_until_disconnected()
+    finally:
+        control_task.cancel()
+        if catch_up_task:
+            catch_up_task.cancel()
+        await ingest_queue.stop()
+        await high_water_marks.stop()
+        await close_db()
+
+def run_worker(index: int, session: str, worker_count: int, match_queue, control_queue):
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(_worker_main(index, session, worker_count, match_queue, control_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+# --- Supervisor process ---
+
+class WorkerHandle:
+    def __init__(self, context, index: int, session: str, worker_count: int, match_queue):
+        self._context = context
+        self.index = index
+        self._args = (index, session, worker_count, match_queue)
+        self.control_queue = None
+        self.process = None
+
+    def start(self):
+        self.control_queue = self._context.Queue()
+        self.process = self._context.Process(
+            target=run_worker, args=(*self._args, self.control_queue), name=f"promo-worker-{self.index}", daemon=True,
+        )
+        self.process.start()
+        logger.info(f"👷 Started worker {self.index} (pid {self.process.pid}).")
+
+    def send(self, command: str):
+        if self.process and self.process.is_alive():
+            self.control_queue.put_nowait(command)
+
+    def stop(self, timeout: float = 15):
+        if not self.process:
+            return
+        self.send("stop")
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning(f"⚠️ Worker {self.index} did not stop in {timeout}s, terminating.")
+            self.process.terminate()
+            self.process.join()
+
+async def _consume_matches(match_queue):
+    """Records and forwards the matches sent by the workers."""
+    loop = asyncio.get_running_loop()
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="match-queue")
+    try:
+        while True:
+            match = await loop.run_in_executor(reader, _get_or_none, match_queue)
+            if match is None:
+                continue
+            message_id, chat_id, text, found = match
+            # Forward when this account can see the source, otherwise send a copy
+            peer = entity_cache.get_input_peer(chat_id)
+            message = ChannelMessage(message_id=message_id, chat_id=chat_id, peer=peer, text=text)
+            try:
+                await record_promo(message, found, copy=peer is None)
+            except Exception as e:
+                logger.error(f"⚠️ Error recording match {message_id} from {chat_id}: {e}")
+    finally:
+        reader.shutdown(wait=False)
+
+async def _watch_workers(workers):
+    """Restarts worker processes that exited, WORKER_RESTART_DELAY seconds after they died."""
+    died_at = {}
+    while True:
+        await asyncio.sleep(WORKER_CHECK_INTERVAL)
+        for worker in workers:
+            if worker.process.is_alive():
+                continue
+            if worker.index not in died_at:
+                died_at[worker.index] = time.monotonic()
+                logger.error(f"🛑 Worker {worker.index} exited with code {worker.process.exitcode}, restarting in {WORKER_RESTART_DELAY}s.")
+            elif time.monotonic() - died_at[worker.index] >= WORKER_RESTART_DELAY:
+                del died_at[worker.index]
+                worker.start()
+
+async def supervise():
+    logger.info(f"🚀 Initializing supervisor with {len(WORKER_SESSIONS)} workers...")
+    try:
+        schema_version = await run_db(run_migrations)
+        logger.info(f"🗄️ Database schema at version {schema_version}.")
+    except Exception as e:
+        logger.error(f"🛑 Database migration failed: {e}")
+        return
+    await reload_data()
+    await load_price_index()
+    await load_routes()
+    await entity_cache.load()
+
+    if not await connect_client():
+        logger.error("🛑 Client connection failed. Exiting.")
+        return
+
+    context = multiprocessing.get_context("spawn")
+    match_queue = context.Queue()
+    workers = [WorkerHandle(context, index, session.strip(), len(WORKER_SESSIONS), match_queue) for index, session in enumerate(WORKER_SESSIONS)]
+    for worker in workers:
+        worker.start()
+
+    def broadcast_reload():
+        for worker in workers:
+            worker.send("reload")
+    add_change_listener(broadcast_reload) # Admin commands change the data in this process only
+    set_worker_count(len(workers)) # /queue_stats and /metrics only see this process
+
+    warm_task = asyncio.create_task(entity_cache.warm(client))
+    price_writer.start()
+    forwarder.start()
+    source_retention.start()
+    if ADMIN_USER_ID != 0:
+        client.add_event_handler(admin_event_handler, admin_events)
+    match_task = asyncio.create_task(_consume_matches(match_queue))
+    watch_task = asyncio.create_task(_watch_workers(workers))
+
+    logger.info("👂 Supervisor listening for worker matches...")
+    try:
+        await client.run_until_disconnected()
+    finally:
+        watch_task.cancel()
+        for worker in workers:
+            await asyncio.to_thread(worker.stop)
+        match_task.cancel()
+        warm_task.cancel()
+        await source_retention.stop()
+        await forwarder.stop()
+        await price_writer.stop()
+        await close_db()
+        await disconnect_client()
+
+
+if __name__ == "__main__":
+    if not WORKER_SESSIONS:
+        logger.error("🛑 WORKER_SESSIONS must list at least one string session (comma separated).")
+    else:
+        try:
+            asyncio.run(supervise())
+        except KeyboardInterrupt:
+            logger.info("\n🛑 Ctrl+C received, shutting down...")
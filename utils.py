@@ -1,24 +1,87 @@
 import re
-from typing import Optional
+from typing import NamedTuple, Optional
 
+# "R$ 1.299,90", "R$1299", "R$ 99,9", "R$ 12.50"
+_PRICE_RE = re.compile(r"R\$\s*(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)(?!\d)")
+# Words right before "R$" that tell which price it is: "de R$" / "era R$" (list
+# price, usually struck through), "por R$" / "a partir de R$" (offer), "10x de R$"
+# (installment), maybe followed by a filler ("por apenas R$"). The pattern is
+# written backwards and matched against the reversed text before "R$", so it
+# is anchored where the label ends and most prices fail on the first letter.
+_LABEL_WINDOW = 24 # Characters before "R$" inspected for those words
+_SEP = r"[([|\-–•*~_]*[\s:]+" # Between two words, reversed: a word may start with a bullet or bracket
+_LABEL_RE = re.compile(
+    r"[\s:]*(?:(?:sanepa|ós|etnemos)" + _SEP + r"){0,3}(?:"
+    r"(?P<offer>ed" + _SEP + r"ritrap|rop)"
+    r"|(?P<installment>ed" + _SEP + r"x(?:\d{1,2})?|x\d{1,2}|x" + _SEP + r"\d+)"
+    r"|(?P<list>ed|are)"
+    r")[([|\-–•*~_]*(?:[\s:]|$)",
+    re.IGNORECASE,
+)
+# What separates an old price from the new one on the same line:
+# "R$ 299,90 → R$ 249,90", "R$ 299,90 por R$ 249,90"
+_PRICE_CHANGE_RE = re.compile(r"[^\S\n]*(?:→|->|=>|➡\ufe0f?|por)[^\S\n]*(?:(?:apenas|só|somente)[^\S\n]*)?", re.IGNORECASE)
+
+PRICE_OFFER = "offer"
+PRICE_LIST = "list"
+PRICE_INSTALLMENT = "installment" # Also the group names of _LABEL_RE
+
+
+class PriceMatch(NamedTuple):
+    start: int
+    end: int
+    value: float
+    kind: Optional[str] # PRICE_OFFER, PRICE_LIST, PRICE_INSTALLMENT or None when unlabelled
+
+
+def _parse_amount(raw: str) -> float:
+    """Converts '1.299,90', '1299', '99,9' or '12.50' to a float."""
+    if "," in raw:
+        return float(raw.replace(".", "").replace(",", "."))
+    if raw.count(".") == 1 and len(raw.rsplit(".", 1)[1]) <= 2:
+        return float(raw) # '12.50': dot used as decimal separator
+    return float(raw.replace(".", ""))
+
+def scan_prices(text: str) -> list[PriceMatch]:
+    """
+    Returns every BRL price in the text, in order, with its parsed value and
+    kind. An unlabelled price followed on its line by "→" or "por" and another
+    price is the old one, so it counts as a list price.
+    """
+    prices = []
+    for match in _PRICE_RE.finditer(text):
+        start = match.start()
+        # Up to _LABEL_WINDOW characters before "R$", last one first
+        window_end = start - _LABEL_WINDOW - 1 if start > _LABEL_WINDOW else None
+        label = _LABEL_RE.match(text[start - 1:window_end:-1]) if start else None
+        if prices and prices[-1].kind is None and _PRICE_CHANGE_RE.fullmatch(text, prices[-1].end, start):
+            prices[-1] = prices[-1]._replace(kind=PRICE_LIST) # Old price of "R$ 299,90 → R$ 249,90"
+        prices.append(PriceMatch(start, match.end(), _parse_amount(match.group(1)), label.lastgroup if label else None))
+    return prices
+
+def best_price(prices: list[PriceMatch]) -> Optional[float]:
+    """
+    Picks the price a product is sold for: the first offer ("por R$") price,
+    else the first unlabelled one, else the first list ("de R$") price.
+    Installment values are never returned.
+    """
+    for kind in (PRICE_OFFER, None, PRICE_LIST):
+        for price in prices:
+            if price.kind == kind:
+                return price.value
+    return None
+
+def has_multiple_offers(prices: list[PriceMatch]) -> bool:
+    """Returns True if more than one price is an actual selling price (not a list or installment price)."""
+    return sum(1 for price in prices if price.kind in (PRICE_OFFER, None)) > 1
 
 def is_multi_product_post(text: str) -> bool:
-    """Returns True if the message contains more than one price."""
-    return len(re.findall(r"R\$\s*[\d.]+(?:,\d{2})?", text)) > 1
+    """Returns True if the message contains more than one selling price."""
+    return has_multiple_offers(scan_prices(text))
 
 def extract_price_from_text(text: str) -> Optional[float]:
     """
-    Extracts a price in BRL from a string, such as 'R$100', 'R$ 100.00', 'R$ 100,00'.
+    Extracts a price in BRL from a string, such as 'R$100', 'R$ 100.00', 'R$ 1.299,00'.
     Returns the price as a float (using '.' as decimal separator), or None if not found.
     """
-    # Match R$ with optional space and either . or , as decimal separator
-    match = re.search(r"R\$\s*([\d.]+,\d{2}|\d+(?:\.\d{2})?)", text)
-    if match:
-        raw_price = match.group(1)
-
-        # Convert Brazilian format to float
-        if "," in raw_price:
-            raw_price = raw_price.replace(".", "").replace(",", ".")
-        return float(raw_price)
-
-    return None
\ No newline at end of file
+    return best_price(scan_prices(text))